@@ -0,0 +1,107 @@
+import json
+import os
+
+STATE_FILE = 'botState.json'
+JOURNAL_SUFFIX = '.journal'
+COMPACT_MIN_RECORDS = 1000
+JOURNAL_FSYNC = False
+
+
+class BotState:
+    # Снимок botState.json плюс журнал изменений: каждое изменение дописывается одной строкой,
+    # а снимок переписывается целиком только при сжатии журнала.
+    def __init__(self, path: str = STATE_FILE):
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self._pending = []
+        self._journal_records = 0
+        self._sections = self._load()
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        if self._needs_compaction():
+            self.compact()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                sections = json.load(file)
+        except FileNotFoundError:
+            sections = {}
+        except ValueError as error:
+            print(f"Не удалось прочитать {self.path}, состояние начнётся с нуля: {error}")
+            sections = {}
+
+        try:
+            with open(self.journal_path, 'rb') as file:
+                content = file.read()
+        except FileNotFoundError:
+            return sections
+
+        # Последняя строка могла оборваться при аварийном завершении: обрезаем её,
+        # иначе следующая запись склеится с обрывком.
+        complete = content[:content.rfind(b'\n') + 1]
+        if len(complete) < len(content):
+            os.truncate(self.journal_path, len(complete))
+
+        for line in complete.decode('utf-8').splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self._apply(sections, record)
+            self._journal_records += 1
+        return sections
+
+    @staticmethod
+    def _apply(sections: dict, record: dict):
+        if record["op"] == 'put':
+            sections.setdefault(record["section"], {})[record["key"]] = record["value"]
+        else:
+            sections.get(record["section"], {}).pop(record["key"], None)
+
+    def __len__(self) -> int:
+        return sum(len(section) for section in self._sections.values())
+
+    def items(self, section: str):
+        return list(self._sections.get(section, {}).items())
+
+    def get(self, section: str, key: str, default=None):
+        return self._sections.get(section, {}).get(key, default)
+
+    def put(self, section: str, key: str, value):
+        self._sections.setdefault(section, {})[key] = value
+        self._pending.append({"op": 'put', "section": section, "key": key, "value": value})
+
+    def delete(self, section: str, key: str):
+        if self._sections.get(section, {}).pop(key, None) is not None:
+            self._pending.append({"op": 'delete', "section": section, "key": key})
+
+    def _needs_compaction(self) -> bool:
+        return self._journal_records >= max(COMPACT_MIN_RECORDS, 2 * len(self))
+
+    def flush(self):
+        if not self._pending:
+            return
+        self._journal.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in self._pending))
+        self._journal.flush()
+        if JOURNAL_FSYNC:
+            os.fsync(self._journal.fileno())
+        self._journal_records += len(self._pending)
+        self._pending.clear()
+        if self._needs_compaction():
+            self.compact()
+
+    def compact(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self._sections, file, ensure_ascii=False)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        # Если процесс упадёт до очистки журнала, его повторное применение к новому снимку ничего не изменит.
+        self._journal.close()
+        self._journal = open(self.journal_path, 'w', encoding='utf-8')
+        self._journal_records = 0
+
+    def close(self):
+        self.flush()
+        self._journal.close()
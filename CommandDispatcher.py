@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+COMMAND_DEBOUNCE_SECONDS = 5
+DEBOUNCE_MAX_SIZE = 10000
+
+
+class CommandDispatcher:
+    def __init__(self):
+        self._exact = {}
+        self._trie = {}
+
+    def command(self, *aliases: str, prefix: bool = False):
+        def register(handler):
+            name = aliases[0]
+            for alias in aliases:
+                if prefix:
+                    node = self._trie
+                    for char in alias:
+                        node = node.setdefault(char, {})
+                    node[None] = (handler, name)
+                else:
+                    self._exact[alias] = (handler, name)
+            return handler
+        return register
+
+    def resolve(self, text: str):
+        found = self._exact.get(text)
+        if found is not None:
+            handler, name = found
+            return handler, name, []
+
+        # Самый длинный зарегистрированный префикс, за которым идёт пробел или конец строки.
+        node = self._trie
+        match = None
+        for index, char in enumerate(text):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node and (index + 1 == len(text) or text[index + 1].isspace()):
+                match = (node[None], index + 1)
+
+        if match is None:
+            return None
+        (handler, name), length = match
+        return handler, name, text[length:].split()
+
+
+class DebounceCache:
+    def __init__(self, ttl: float = COMMAND_DEBOUNCE_SECONDS, max_size: int = DEBOUNCE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._seen = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def hit(self, key, now: float) -> bool:
+        # Записи упорядочены по времени, поэтому устаревшие всегда лежат в начале.
+        while self._seen:
+            oldest_key, oldest_time = next(iter(self._seen.items()))
+            if now - oldest_time < self.ttl:
+                break
+            del self._seen[oldest_key]
+
+        if key in self._seen:
+            return True
+
+        self._seen[key] = now
+        if len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        return False
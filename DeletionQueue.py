@@ -0,0 +1,65 @@
+import asyncio
+import heapq
+import math
+import time as time_module
+
+DELETE_AFTER = 600
+DELETE_GRANULARITY = 30
+DELETE_BATCH_SIZE = 100
+MAX_SLEEP = 300
+STATE_SECTION = 'deletions'
+
+
+class DeletionQueue:
+    def __init__(self, state, delete_after: float = DELETE_AFTER):
+        self.state = state
+        self.delete_after = delete_after
+        self._wakeup = asyncio.Event()
+        self._heap = [(entry["due"], entry["peer_id"], entry["cmid"]) for _, entry in state.items(STATE_SECTION)]
+        heapq.heapify(self._heap)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def add(self, peer_id, cmid, delay: float = None):
+        if delay is None:
+            delay = self.delete_after
+        # Срок округляется вверх, чтобы сообщения одного чата удалялись одним запросом.
+        due = math.ceil((time_module.time() + delay) / DELETE_GRANULARITY) * DELETE_GRANULARITY
+        heapq.heappush(self._heap, (due, peer_id, cmid))
+        self.state.put(STATE_SECTION, f"{peer_id}_{cmid}", {"due": due, "peer_id": peer_id, "cmid": cmid})
+        self.state.flush()
+        if self._heap[0][2] == cmid and self._heap[0][1] == peer_id:
+            self._wakeup.set()
+
+    def pop_due(self, now: float) -> dict:
+        cmids_by_peer = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, peer_id, cmid = heapq.heappop(self._heap)
+            cmids_by_peer.setdefault(peer_id, []).append(cmid)
+        return cmids_by_peer
+
+    def forget(self, peer_id, cmids: list):
+        for cmid in cmids:
+            self.state.delete(STATE_SECTION, f"{peer_id}_{cmid}")
+        self.state.flush()
+
+    async def run(self, delete_callback):
+        while True:
+            self._wakeup.clear()
+            for peer_id, cmids in self.pop_due(time_module.time()).items():
+                for start in range(0, len(cmids), DELETE_BATCH_SIZE):
+                    batch = cmids[start:start + DELETE_BATCH_SIZE]
+                    try:
+                        await delete_callback(peer_id, batch)
+                    except Exception as error:
+                        print(f"Не удалось удалить сообщения {batch} в {peer_id}: {error!r}")
+                    self.forget(peer_id, batch)
+
+            timeout = MAX_SLEEP
+            if self._heap:
+                timeout = min(max(self._heap[0][0] - time_module.time(), 0), MAX_SLEEP)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,324 @@
+import collections
+import contextlib
+import math
+import os
+import sys
+import threading
+import time as time_module
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9101
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROFILE_INTERVAL = 0.01
+PROFILE_MAX_STACKS = 5000
+METRICS_THREAD_NAME = 'metrics-server'
+
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra: str = '') -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def parse_positive(query: dict, name: str, convert):
+    if name not in query:
+        return None
+    value = convert(query[name][0])
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError(f"{name} должен быть положительным числом")
+    return value
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, label_values: tuple) -> tuple:
+        if len(label_values) != len(self.labels):
+            raise ValueError(f"{self.name}: ожидались метки {self.labels}, получено {label_values}")
+        return tuple(str(value) for value in label_values)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, format_labels(self.labels, key), value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {format_value(value)}" for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount: float = 1):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, *label_values):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = value
+
+
+class CallbackGauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def samples(self):
+        try:
+            value = self.callback()
+        except Exception:
+            return
+        yield self.name, '', value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, *label_values):
+        key = self._key(label_values)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Счётчики корзин хранятся без накопления, суммируются при выводе.
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, *label_values):
+        started = time_module.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time_module.perf_counter() - started, *label_values)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series[0]), series[1], series[2]) for key, series in self._values.items()]
+        for key, bucket_counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", format_labels(self.labels, key, f'le="{format_value(bound)}"'), cumulative
+            yield f"{self.name}_sum", format_labels(self.labels, key), total
+            yield f"{self.name}_count", format_labels(self.labels, key), count
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"Метрика {metric.name} уже зарегистрирована как {existing.kind}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def gauge_callback(self, name: str, documentation: str, callback) -> CallbackGauge:
+        return self._register(CallbackGauge(name, documentation, callback))
+
+    def histogram(self, name: str, documentation: str, labels: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL, max_stacks: int = PROFILE_MAX_STACKS):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.samples = 0
+        self._stacks = collections.Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = None):
+        with self._lock:
+            if interval is not None:
+                self.interval = interval
+            if self.running:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                self.samples += 1
+                for thread_id, frame in frames.items():
+                    thread_name = thread_names.get(thread_id, str(thread_id))
+                    if thread_id == own_id or thread_name.startswith(METRICS_THREAD_NAME):
+                        continue
+                    stack = self.format_stack(thread_name, frame)
+                    if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                        stack = '[прочее]'
+                    self._stacks[stack] += 1
+
+    @staticmethod
+    def format_stack(thread_name: str, frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        names.append(thread_name)
+        return ';'.join(reversed(names))
+
+    def render(self, limit: int = None) -> str:
+        # Свёрнутые стеки в формате flamegraph.pl: "стек количество".
+        with self._lock:
+            stacks = self._stacks.most_common(limit)
+            samples = self.samples
+        lines = [f"# samples={samples} interval={self.interval} running={int(self.running)}"]
+        lines.extend(f"{stack} {count}" for stack, count in stacks)
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+profiler = SamplingProfiler()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def _reply(self, status: int, body: str, content_type: str = 'text/plain; charset=utf-8'):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/metrics':
+            self._reply(200, registry.render(), 'text/plain; version=0.0.4; charset=utf-8')
+        elif url.path == '/profile':
+            try:
+                limit = parse_positive(query, 'limit', int)
+            except ValueError:
+                self._reply(400, "Параметр limit должен быть положительным целым числом.\n")
+                return
+            self._reply(200, profiler.render(limit))
+        else:
+            self._reply(404, "Не найдено.\n")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/profile/start':
+            try:
+                interval = parse_positive(query, 'interval', float)
+            except ValueError:
+                self._reply(400, "Параметр interval должен быть положительным числом.\n")
+                return
+            profiler.start(interval)
+            self._reply(200, "Профилирование включено.\n")
+        elif url.path == '/profile/stop':
+            profiler.stop()
+            self._reply(200, "Профилирование выключено.\n")
+        elif url.path == '/profile/reset':
+            profiler.reset()
+            self._reply(200, "Профиль очищен.\n")
+        else:
+            self._reply(404, "Не найдено.\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def process_request(self, request, client_address):
+        # Потоки запросов названы по серверу, чтобы профилировщик не снимал их стеки.
+        threading.Thread(target=self.process_request_thread, args=(request, client_address),
+                         name=f"{METRICS_THREAD_NAME}-request", daemon=True).start()
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    # Метрики необязательны: если порт занят, бот и парсер работают без них.
+    try:
+        server = MetricsServer((host, port), MetricsHandler)
+    except OSError as error:
+        print(f"Не удалось запустить сервер метрик на {host}:{port}: {error}")
+        return None
+    threading.Thread(target=server.serve_forever, name=METRICS_THREAD_NAME, daemon=True).start()
+    print(f"Метрики доступны на http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -1,21 +1,35 @@
+import bisect
 import dataclasses
+import hashlib
+import io
 import re
 import json
 import os
-from datetime import datetime, timedelta
+import shutil
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup, Tag, PageElement
 import schedule as scheduler
 import time as time_module
+from Metrics import registry, start_metrics_server
+from ScheduleStore import notify_schedule_updated
+from ScheduleDiff import diff_group
+from ScheduleDatabase import DB_FILE, ScheduleDatabase
 
-def get_semester_and_group_number(current_date: datetime) -> (str, str):
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+def get_semester_and_group_number(current_date: datetime, group_number: str = "your_group") -> (str, str):
     if current_date.month in [9, 10, 11, 12]:
         semester = "osenniy"
     else:
         semester = "vesenniy"
 
-    group_number = "your_group"
-
     if current_date.month == 7:
         number_part = ''.join(filter(lambda x: x.isdigit(), group_number))
         letter_part = ''.join(filter(lambda x: x.isalpha(), group_number))
@@ -24,17 +38,57 @@ def get_semester_and_group_number(current_date: datetime) -> (str, str):
 
     return semester, group_number
 
+TIMETABLE_BASE_URL = "https://www.sibstrin.ru/timetable/group"
+
+
+def get_table_url(semester: str, group: str) -> str:
+    return f"{TIMETABLE_BASE_URL}/{semester}/{group}.htm"
+
+
 current_date = datetime.now()
 semester, group_number = get_semester_and_group_number(current_date)
-TABLE_URL = f"https://www.sibstrin.ru/timetable/group/{semester}/{group_number}.htm"
+TABLE_URL = get_table_url(semester, group_number)
 TIME_REGEX = re.compile(r'(\d{2}:\d{2})\s*-\s*(\d{2}:\d{2})')
+ROOM_REGEX = re.compile(r'(\d+)[а-яА-Я]?')
+GROUP_REGEX = re.compile(r'(\d+.*?\s*гр\.)')
+LOCATION_REGEX = re.compile(r'([А-Яа-я]+\./\s*\d+[а-яА-Я]?\s*ауд\.)')
+LOCATION_FALLBACK_REGEX = re.compile(r'([А-Яа-я]+\s*[А-Яа-я]+\s*/\s*\d+[а-яА-Я]?\s*ауд\.)')
+TEACHER_REGEX = re.compile(r'([А-Я][а-я]+\s+[А-Я]\.\s*[А-Я]\.)')
+PHYSICAL_EDUCATION = "Элективные курсы по физической культуре и спорту"
+PAYLOAD_CACHE_SIZE = 4096
 JSON_FILE = 'univBase.json'
+GROUPS_FILE = 'groups.txt'
+BUILDINGS_FILE = 'buildings.json'
+FETCH_STATE_FILE = 'fetchState.json'
+SCHEMA_VERSION = 2
+SNAPSHOTS_DIR = 'snapshots'
+SNAPSHOTS_KEEP = 5
+SNAPSHOT_REGEX = re.compile(r'univBase\.(\d+)\.json')
+REPLACE_ATTEMPTS = 20
+REPLACE_RETRY_DELAY = 0.05
+FETCH_WORKERS = 16
+PARSE_WORKERS = os.cpu_count() or 1
+SCRAPER_METRICS_PORT = 9102
+FETCH_TIMEOUT = 30
+PARSER_BACKEND = 'lxml' if etree is not None else 'bs4'
 
 
 @dataclasses.dataclass
 class Lesson:
+    date: date
+    weekday: str
+    start_time: time
+    end_time: time
+    payload: str
+    building: str
+    group: str
+    subject: str
+    teacher: str
+    location: str
+
     def __init__(self, date, weekday, start_time, end_time, payload, building=None):
-        if "Элективные курсы по физической культуре и спорту" in payload:
+        self.group, self.subject, self.teacher, self.location, payload_building = parse_cell_payload(payload)
+        if PHYSICAL_EDUCATION in payload:
             payload = payload[:-12]
             building = ""
         self.date = date
@@ -42,41 +96,42 @@ class Lesson:
         self.start_time = start_time
         self.end_time = end_time
         self.payload = payload
-        self.building = building
-        self.group, self.subject, self.teacher, self.location = self.parse_payload(payload)
+        self.building = payload_building if building is None else building
 
 
     @classmethod
     def create(cls, *, time_cell: Tag, date_cell: Tag, weekday_cell: Tag, lesson_cell: Tag) -> 'Lesson':
-        start_time_str, end_time_str = TIME_REGEX.match(time_cell.get_text(strip=True)).groups()
-        payload = lesson_cell.get_text(strip=True)
-        room_match = re.findall(r'(\d+)[а-яА-Я]?', payload)
-        building = "Неизвестный корпус"
-        if room_match:
-            room_number = int(room_match[-1])
-            building = get_building_by_room(room_number)
+        return cls.from_text(
+            time_text=time_cell.get_text(strip=True),
+            date_text=date_cell.get_text(strip=True),
+            weekday_text=weekday_cell.get_text(strip=True),
+            payload=lesson_cell.get_text(strip=True),
+        )
+
 
+    @classmethod
+    def from_text(cls, *, time_text: str, date_text: str, weekday_text: str, payload: str) -> 'Lesson':
+        start_time, end_time = parse_time_range(time_text)
         return cls(
-            date=datetime.strptime(date_cell.get_text(strip=True), '%d.%m.%Y').date(),
-            weekday=weekday_cell.get_text(strip=True),
-            start_time=datetime.strptime(start_time_str, '%H:%M').time(),
-            end_time=datetime.strptime(end_time_str, '%H:%M').time(),
+            date=parse_date(date_text),
+            weekday=weekday_text,
+            start_time=start_time,
+            end_time=end_time,
             payload=payload,
-            building=building
         )
 
 
     @staticmethod
     def parse_payload(payload: str):
-        group_match = re.search(r'(\d+.*?\s*гр\.)', payload)
+        group_match = GROUP_REGEX.search(payload)
         group = group_match.group(0) if group_match else ''
         payload = payload.replace(group, '').strip()
-        lesson_type_location_match = re.search(r'([А-Яа-я]+\./\s*\d+[а-яА-Я]?\s*ауд\.)', payload)
+        lesson_type_location_match = LOCATION_REGEX.search(payload)
         if not lesson_type_location_match:
-            lesson_type_location_match = re.search(r'([А-Яа-я]+\s*[А-Яа-я]+\s*/\s*\d+[а-яА-Я]?\s*ауд\.)', payload)
+            lesson_type_location_match = LOCATION_FALLBACK_REGEX.search(payload)
         location = lesson_type_location_match.group(0) if lesson_type_location_match else ''  # Место занятия.
         payload = payload.replace(location, '').strip()
-        teacher_match = re.search(r'([А-Я][а-я]+\s+[А-Я]\.\s*[А-Я]\.)', payload)
+        teacher_match = TEACHER_REGEX.search(payload)
         teacher = teacher_match.group(0) if teacher_match else ''
         payload = payload.replace(teacher, '').strip()
         subject = payload.strip().upper()
@@ -84,19 +139,65 @@ class Lesson:
         return group, subject, teacher, location
 
 
+@lru_cache(maxsize=PAYLOAD_CACHE_SIZE)
+def parse_cell_payload(payload: str) -> tuple[str, str, str, str, str]:
+    # Одни и те же ячейки повторяются каждую неделю, поэтому разбор кэшируется по исходному тексту.
+    room_match = ROOM_REGEX.findall(payload)
+    building = get_building_by_room(int(room_match[-1])) if room_match else "Неизвестный корпус"
+    if PHYSICAL_EDUCATION in payload:
+        payload = payload[:-12]
+        building = ""
+    group, subject, teacher, location = Lesson.parse_payload(payload)
+    return group, subject, teacher, location, building
+
+
+@lru_cache(maxsize=64)
+def parse_time_range(time_text: str) -> tuple[time, time]:
+    start_time_str, end_time_str = TIME_REGEX.match(time_text).groups()
+    return datetime.strptime(start_time_str, '%H:%M').time(), datetime.strptime(end_time_str, '%H:%M').time()
+
+
+@lru_cache(maxsize=512)
+def parse_date(date_text: str) -> date:
+    return datetime.strptime(date_text, '%d.%m.%Y').date()
+
+
+DEFAULT_BUILDINGS = {
+    "Главный корпус.": [(102, 122), (202, 239), (302, 326), (401, 428)],
+    "Пристройка главного корпуса.": [(132, 139), (240, 251), (338, 347), (433, 438), (504, 511)],
+    "Учебный корпус №3.": [(291, 296), (391, 396)],
+    "Учебный корпус №4.": [(4001, 4309)],
+    "Лабораторный корпус.": [(151, 181), (255, 285), (351, 382)],
+}
+UNKNOWN_BUILDING = "Неизвестный корпус."
+
+
+def build_building_table(buildings: dict) -> tuple[list[int], list[tuple[int, int, str]]]:
+    intervals = sorted((int(start), int(end), name) for name, ranges in buildings.items() for start, end in ranges)
+    for (_, previous_end, previous_name), (start, _, name) in zip(intervals, intervals[1:]):
+        if start <= previous_end:
+            raise ValueError(f"Аудитории корпусов «{previous_name}» и «{name}» пересекаются: {start}")
+    return [start for start, _, _ in intervals], intervals
+
+
+def load_building_table(path: str = BUILDINGS_FILE) -> tuple[list[int], list[tuple[int, int, str]]]:
+    if not os.path.exists(path):
+        return build_building_table(DEFAULT_BUILDINGS)
+
+    with open(path, 'r', encoding='utf-8') as file:
+        return build_building_table(json.load(file))
+
+
+BUILDING_STARTS, BUILDING_INTERVALS = load_building_table()
+
+
 def get_building_by_room(room_number: int) -> str:
-    if 102 <= room_number <= 122 or 202 <= room_number <= 239 or 302 <= room_number <= 326 or 401 <= room_number <= 428:
-        return "Главный корпус."
-    elif 132 <= room_number <= 139 or 240 <= room_number <= 251 or 338 <= room_number <= 347 or 433 <= room_number <= 438 or 504 <= room_number <= 511:
-        return "Пристройка главного корпуса."
-    elif 291 <= room_number <= 296 or 391 <= room_number <= 396:
-        return "Учебный корпус №3."
-    elif 4001 <= room_number <= 4309:
-        return "Учебный корпус №4."
-    elif 151 <= room_number <= 181 or 255 <= room_number <= 285 or 351 <= room_number <= 382:
-        return "Лабораторный корпус."
-    else:
-        return "Неизвестный корпус."
+    index = bisect.bisect_right(BUILDING_STARTS, room_number) - 1
+    if index >= 0:
+        _, end, name = BUILDING_INTERVALS[index]
+        if room_number <= end:
+            return name
+    return UNKNOWN_BUILDING
 
 
 def get_rowspan(cell: Tag) -> int:
@@ -107,10 +208,93 @@ def get_next_tag_sibling(element: PageElement) -> Tag:
     return next(s for s in element.next_siblings if isinstance(s, Tag))
 
 
-def parse_lessons() -> list[Lesson]:
-    response = requests.get(TABLE_URL, verify=False)
+def load_group_numbers(current_date: datetime) -> list[str]:
+    if not os.path.exists(GROUPS_FILE):
+        return [group_number]
+
+    with open(GROUPS_FILE, 'r', encoding='utf-8') as file:
+        groups = [line.strip() for line in file if line.strip() and not line.startswith('#')]
+
+    return [get_semester_and_group_number(current_date, group)[1] for group in groups]
+
+
+def create_session(pool_size: int = FETCH_WORKERS) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=2)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.verify = False
+    return session
+
+
+@dataclasses.dataclass
+class FetchResult:
+    content: bytes
+    etag: str | None
+    last_modified: str | None
+    content_hash: str
+
+    def to_state(self) -> dict:
+        return {"etag": self.etag, "last_modified": self.last_modified, "hash": self.content_hash}
+
+
+scrape_fetch_seconds = registry.gauge(
+    'univbot_scrape_fetch_seconds', "Время загрузки страницы группы при последнем обновлении.", ('group',))
+scrape_parse_seconds = registry.gauge(
+    'univbot_scrape_parse_seconds', "Время разбора страницы группы при последнем обновлении.", ('group',))
+scrape_results = registry.counter('univbot_scrape_results_total', "Итоги обработки страниц групп.", ('result',))
+update_latency = registry.histogram(
+    'univbot_scrape_update_seconds', "Длительность полного обновления расписания.",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+
+
+def fetch_timetable(session: requests.Session, url: str, state: dict = None) -> FetchResult | None:
+    state = state or {}
+    headers = {}
+    if state.get("etag"):
+        headers['If-None-Match'] = state["etag"]
+    if state.get("last_modified"):
+        headers['If-Modified-Since'] = state["last_modified"]
+
+    response = session.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+    if response.status_code == 304:
+        return None
     response.raise_for_status()
-    soup = BeautifulSoup(response.content, 'html.parser')
+
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    if content_hash == state.get("hash"):
+        # Сервер не поддерживает условные запросы, но страница не изменилась.
+        state["etag"] = response.headers.get('ETag')
+        state["last_modified"] = response.headers.get('Last-Modified')
+        return None
+
+    return FetchResult(
+        content=response.content,
+        etag=response.headers.get('ETag'),
+        last_modified=response.headers.get('Last-Modified'),
+        content_hash=content_hash,
+    )
+
+
+def timed_fetch_timetable(session: requests.Session, url: str, state: dict = None) -> tuple[FetchResult | None, float]:
+    started = time_module.perf_counter()
+    result = fetch_timetable(session, url, state)
+    return result, time_module.perf_counter() - started
+
+
+def parse_lessons(content: bytes, backend: str = None) -> list[Lesson]:
+    return PARSER_BACKENDS[backend or PARSER_BACKEND](content)
+
+
+def timed_parse_lessons(content: bytes, backend: str = None) -> tuple[list[Lesson], float]:
+    # Время замеряется в рабочем процессе, чтобы не учитывать ожидание в очереди пула.
+    started = time_module.perf_counter()
+    lessons = parse_lessons(content, backend)
+    return lessons, time_module.perf_counter() - started
+
+
+def parse_lessons_bs4(content: bytes) -> list[Lesson]:
+    soup = BeautifulSoup(content, 'html.parser')
     time_row = soup.find('tr', class_='R3')
     assert time_row, 'No time header'
     time_cells = time_row.find_all('td')
@@ -161,12 +345,94 @@ def parse_lessons() -> list[Lesson]:
     return lessons
 
 
+def get_cell_text(cell) -> str:
+    return ''.join(text.strip() for text in cell.itertext())
+
+
+def has_class(row, class_name: str) -> bool:
+    return class_name in (row.get('class') or '').split()
+
+
+def parse_lessons_lxml(content: bytes) -> list[Lesson]:
+    # Потоковый разбор: строки таблицы освобождаются сразу после обработки,
+    # а из ячеек сохраняется только текст.
+    time_texts = None
+    lessons = []
+    pending_row = None
+
+    for _, row in etree.iterparse(io.BytesIO(content), events=('end',), tag='tr', html=True):
+        if pending_row is not None:
+            next_row_texts = [get_cell_text(cell) for cell in row.iter('td')]
+            lessons.extend(
+                Lesson.from_text(**texts) if next_index is None
+                else Lesson.from_text(**dict(texts, payload=next_row_texts[next_index]))
+                for texts, next_index in pending_row
+            )
+            pending_row = None
+
+        if time_texts is None and has_class(row, 'R3'):
+            time_texts = [get_cell_text(cell) for cell in row.iter('td')]
+            assert time_texts, 'No times'
+
+        elif has_class(row, 'R4'):
+            assert time_texts is not None, 'No time header'
+            row_cells = list(row.iter('td'))
+            maybe_week_cell, *other_cells = row_cells
+
+            if get_rowspan(maybe_week_cell) > 2:
+                row_cells = other_cells
+
+            weekday_cell, date_cell, *lesson_cells = row_cells
+            rowspan = get_rowspan(weekday_cell)
+            assert rowspan in (1, 2)
+            weekday_text = get_cell_text(weekday_cell)
+            date_text = get_cell_text(date_cell)
+            row_lessons = []
+            skip_lesson_in_next_rows = 0
+
+            for time_text, lesson_cell in zip(time_texts[3:], lesson_cells):
+                if not time_text:
+                    continue
+                payload = get_cell_text(lesson_cell)
+                if not payload:
+                    continue
+
+                texts = dict(time_text=time_text, date_text=date_text, weekday_text=weekday_text, payload=payload)
+                row_lessons.append((texts, None))
+
+                if rowspan == 2 and get_rowspan(lesson_cell) == 1:
+                    row_lessons.append((texts, skip_lesson_in_next_rows))
+                    skip_lesson_in_next_rows += 1
+
+            if skip_lesson_in_next_rows:
+                pending_row = row_lessons
+            else:
+                lessons.extend(Lesson.from_text(**texts) for texts, _ in row_lessons)
+
+        row.clear()
+        while row.getprevious() is not None:
+            del row.getparent()[0]
+
+    assert time_texts is not None, 'No time header'
+    return lessons
+
+
+PARSER_BACKENDS = {
+    'bs4': parse_lessons_bs4,
+    'lxml': parse_lessons_lxml,
+}
+
+
+def get_week_parity(lesson_date: date) -> int:
+    return 1 if lesson_date.isocalendar()[1] % 2 == 1 else 2
+
+
 def split_lesson_by_week(lessons: list[Lesson]) -> dict:
     first_week = []
     second_week = []
 
     for lesson in lessons:
-        if (lesson.date.isocalendar()[1] % 2) == 1:
+        if get_week_parity(lesson.date) == 1:
             first_week.append(lesson)
         else:
             second_week.append(lesson)
@@ -182,79 +448,272 @@ def split_lesson_by_week(lessons: list[Lesson]) -> dict:
     }
 
 
-def save_lesson_to_json(lessons_by_week: dict):
-    formatted_data = {
-        "lessons": {
-            "first_week": [],
-            "second_week": []
-        }
+def time_to_minutes(value) -> int:
+    return value.hour * 60 + value.minute
+
+
+def lesson_to_record(lesson: Lesson, week: int) -> dict:
+    return {
+        "date": lesson.date.isoformat(),
+        "start": time_to_minutes(lesson.start_time),
+        "end": time_to_minutes(lesson.end_time),
+        "subject": lesson.subject,
+        "teacher": lesson.teacher,
+        "location": lesson.location,
+        "building": lesson.building,
+        "week": week,
     }
 
-    weekdays_translation = {
-        'Monday': 'Пн.',
-        'Tuesday': 'Вт.',
-        'Wednesday': 'Ср.',
-        'Thursday': 'Чт.',
-        'Friday': 'Пт.',
-        'Saturday': 'Сб.',
-        'Sunday': 'Вс.'
+
+def create_parse_pool(workers: int, jobs: int):
+    if workers > 1 and jobs > 1:
+        return ProcessPoolExecutor(min(workers, jobs))
+    return ThreadPoolExecutor(1)
+
+
+def scrape_groups(groups: list[str], semester: str, fetch_state: dict = None, fetch_workers: int = FETCH_WORKERS,
+                  parse_workers: int = PARSE_WORKERS) -> dict[str, list[Lesson]]:
+    if fetch_state is None:
+        fetch_state = {}
+    lessons_by_group = {}
+
+    with create_session(fetch_workers) as session, \
+            ThreadPoolExecutor(fetch_workers) as fetch_pool, \
+            create_parse_pool(parse_workers, len(groups)) as parse_pool:
+        fetches = {
+            fetch_pool.submit(
+                timed_fetch_timetable, session, get_table_url(semester, group), fetch_state.setdefault(group, {})
+            ): group
+            for group in groups
+        }
+        parses = {}
+        for future in as_completed(fetches):
+            group = fetches[future]
+            try:
+                result, seconds = future.result()
+            except requests.RequestException as error:
+                scrape_results.inc('fetch_error')
+                print(f"Не удалось загрузить расписание группы {group}: {error}")
+                continue
+            scrape_fetch_seconds.set(seconds, group)
+            if result is None:
+                scrape_results.inc('not_modified')
+                continue
+            parses[parse_pool.submit(timed_parse_lessons, result.content, PARSER_BACKEND)] = (group, result)
+
+        for future in as_completed(parses):
+            group, result = parses[future]
+            try:
+                lessons_by_group[group], seconds = future.result()
+                fetch_state[group] = result.to_state()
+                scrape_parse_seconds.set(seconds, group)
+                scrape_results.inc('changed')
+            except Exception as error:
+                # Любая ошибка разбора одной страницы (в том числе IndexError и StopIteration на битой таблице)
+                # оставляет группе прежнее расписание и не прерывает обновление остальных.
+                scrape_results.inc('parse_error')
+                print(f"Не удалось разобрать расписание группы {group}: {error!r}")
+
+    return lessons_by_group
+
+
+def build_group_data(lessons_by_week: dict) -> dict:
+    group_data = {
+        "weeks": {},
+        "lessons": []
     }
 
-    for week, lessons in zip(["first_week", "second_week"],
-                             [lessons_by_week["lessons"]["first_week"],
-                              lessons_by_week["lessons"]["second_week"]]):
+    for week, week_key in ((1, "first_week"), (2, "second_week")):
+        lessons = lessons_by_week["lessons"][week_key]
+        if not lessons:
+            continue
 
-        if week == "first_week":
-            formatted_data["lessons"][week].append("Расписание на первую неделю:\n\n")
-        else:
-            formatted_data["lessons"][week].append("Расписание на вторую неделю:\n\n")
+        start_date = min(lesson.date for lesson in lessons)
+        end_date = start_date + timedelta(days=7)
+        group_data["weeks"][str(week)] = start_date.isoformat()
+        group_data["lessons"].extend(
+            lesson_to_record(lesson, week) for lesson in lessons if lesson.date < end_date
+        )
 
-        lesson_dates = {lesson.date for lesson in lessons}
+    return group_data
 
-        if lessons:
-            start_date = min(lesson.date for lesson in lessons)
-            date_range = [start_date + timedelta(days=i) for i in range(7)]
-        else:
-            date_range = []
-
-        for date in date_range:
-            weekday_name = date.strftime('%A')
-            short_weekday = weekdays_translation.get(weekday_name, weekday_name)
-
-            if date in lesson_dates:
-                for lesson in lessons:
-                    if lesson.date == date:
-                        formatted_data["lessons"][week].append(
-                            f"{lesson.date.strftime('%d.%m.%Y')} | {short_weekday}\n"
-                            f"[{lesson.start_time.strftime('%H:%M')} - {lesson.end_time.strftime('%H:%M')}]\n"
-                            f"Предмет: {lesson.subject}.\n"
-                            f"Преподаватель: {lesson.teacher}\n"
-                            f"Аудитория: {lesson.location}\n"
-                            f"Корпус: {lesson.building}\n\n"
-                        )
-            else:
-                formatted_data["lessons"][week].append(
-                    f"{date.strftime('%d.%m.%Y')} | {short_weekday}\n"
-                    f"Выходной! Нет ничего лучше выходных, правда?\n\n"
-                )
 
-    if os.path.exists(JSON_FILE):
-        os.remove(JSON_FILE)
+def load_saved_snapshot() -> dict:
+    if not os.path.exists(JSON_FILE):
+        return {}
 
-    with open(JSON_FILE, 'w', encoding='utf-8') as file:
-        json.dump(formatted_data, file, ensure_ascii=False, indent=4)
+    try:
+        with open(JSON_FILE, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+    except ValueError:
+        return {}
 
+    if data.get("version") != SCHEMA_VERSION:
+        return {}
+    return data
+
+
+def load_saved_groups() -> dict:
+    return load_saved_snapshot().get("groups", {})
+
+
+def load_fetch_state(groups: dict) -> dict:
+    if not os.path.exists(FETCH_STATE_FILE):
+        return {}
+
+    try:
+        with open(FETCH_STATE_FILE, 'r', encoding='utf-8') as file:
+            fetch_state = json.load(file)
+    except ValueError:
+        return {}
+
+    # Без сохранённого расписания группу нужно разобрать заново, даже если страница не менялась.
+    return {group: state for group, state in fetch_state.items() if group in groups}
+
+
+def save_fetch_state(fetch_state: dict):
+    with open(FETCH_STATE_FILE, 'w', encoding='utf-8') as file:
+        json.dump(fetch_state, file, ensure_ascii=False, indent=4)
+
+
+def get_snapshot_path(generation: int) -> str:
+    return os.path.join(SNAPSHOTS_DIR, f"univBase.{generation:08d}.json")
+
+
+def list_snapshot_generations() -> list[int]:
+    if not os.path.isdir(SNAPSHOTS_DIR):
+        return []
+    generations = []
+    for name in os.listdir(SNAPSHOTS_DIR):
+        match = SNAPSHOT_REGEX.fullmatch(name)
+        if match:
+            generations.append(int(match.group(1)))
+    return sorted(generations)
+
+
+def get_next_generation(saved_snapshot: dict) -> int:
+    # Номер растёт, даже если univBase.json удалили или заменили старой копией.
+    return max([saved_snapshot.get("generation", 0), *list_snapshot_generations()]) + 1
+
+
+def replace_file(source: str, target: str):
+    # В Windows замена не проходит, пока бот держит файл открытым на чтение.
+    for attempt in range(REPLACE_ATTEMPTS):
+        try:
+            os.replace(source, target)
+            return
+        except PermissionError:
+            if attempt == REPLACE_ATTEMPTS - 1:
+                raise
+            time_module.sleep(REPLACE_RETRY_DELAY)
+
+
+def prune_snapshots(keep: int = SNAPSHOTS_KEEP):
+    for generation in list_snapshot_generations()[:-keep]:
+        try:
+            os.remove(get_snapshot_path(generation))
+        except OSError as error:
+            print(f"Не удалось удалить старый снимок расписания {generation}: {error}")
+
+
+def save_groups_to_json(groups_data: dict, generation: int = 1, changes: dict = None):
+    formatted_data = {
+        "version": SCHEMA_VERSION,
+        "generation": generation,
+        "groups": groups_data
+    }
+    if changes is not None:
+        formatted_data["changes"] = changes
+
+    # Новая версия целиком пишется во временный файл и публикуется атомарной заменой,
+    # поэтому бот всегда читает либо старый, либо новый файл полностью.
+    temp_file = JSON_FILE + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        json.dump(formatted_data, file, ensure_ascii=False, indent=4)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.makedirs(SNAPSHOTS_DIR, exist_ok=True)
+    shutil.copyfile(temp_file, get_snapshot_path(generation))
+    replace_file(temp_file, JSON_FILE)
+    prune_snapshots()
+
+
+def save_groups_to_db(lessons_by_group: dict[str, list[Lesson]], fetch_state: dict, groups: list[str]):
+    database = ScheduleDatabase(DB_FILE, readonly=False)
+    try:
+        database.replace_groups(
+            {group: [lesson_to_record(lesson, get_week_parity(lesson.date)) for lesson in lessons]
+             for group, lessons in lessons_by_group.items()},
+            {group: fetch_state[group]["hash"] for group in lessons_by_group},
+            keep_groups=set(groups),
+        )
+    finally:
+        database.close()
+
+
+def load_db_groups() -> set[str]:
+    if not os.path.exists(DB_FILE):
+        return set()
+    database = ScheduleDatabase(DB_FILE, readonly=False)
+    try:
+        return database.get_group_names()
+    finally:
+        database.close()
+
+
+def update_lesson() -> bool:
+    with update_latency.time():
+        return update_groups()
+
+
+def update_groups() -> bool:
+    current_date = datetime.now()
+    semester, _ = get_semester_and_group_number(current_date)
+    groups = load_group_numbers(current_date)
+    saved_snapshot = load_saved_snapshot()
+    all_saved_groups = saved_snapshot.get("groups", {})
+    # Группы, которые не удалось обновить, сохраняют прошлое расписание.
+    saved_groups = {group: data for group, data in all_saved_groups.items() if group in groups}
+    # Группу, которой ещё нет в базе семестра, нужно разобрать заново.
+    db_groups = load_db_groups()
+    fetch_state = load_fetch_state({group: data for group, data in saved_groups.items() if group in db_groups})
+
+    lessons_by_group = scrape_groups(groups, semester, fetch_state)
+    save_fetch_state({group: state for group, state in fetch_state.items() if state})
+
+    if not lessons_by_group and saved_groups.keys() == all_saved_groups.keys():
+        print("Расписание не изменилось.")
+        return False
+
+    save_groups_to_db(lessons_by_group, fetch_state, groups)
+
+    changes_by_group = {}
+    for group, lessons in lessons_by_group.items():
+        group_data = build_group_data(split_lesson_by_week(lessons))
+        group_data["hash"] = fetch_state[group]["hash"]
+        if group in saved_groups:
+            group_changes = diff_group(saved_groups[group], group_data)
+            if group_changes:
+                changes_by_group[group] = group_changes
+        saved_groups[group] = group_data
+
+    generation = get_next_generation(saved_snapshot)
+    # Бот применяет готовый список изменений, только если у него загружена версия from_generation.
+    changes = {"from_generation": saved_snapshot.get("generation"), "groups": changes_by_group}
+    save_groups_to_json(saved_groups, generation, changes)
+    if changes_by_group:
+        print(f"Изменения в расписании: {sum(map(len, changes_by_group.values()))} пар в {len(changes_by_group)} группах.")
+    notify_schedule_updated()
+    print(f"Расписание {len(lessons_by_group)} из {len(groups)} групп обновлено и сохранено в {JSON_FILE} (версия {generation}).")
+    return True
 
-def update_lesson():
-    lessons = parse_lessons()
-    lessons_by_week = split_lesson_by_week(lessons)
-    save_lesson_to_json(lessons_by_week)
-    print(f"Расписание обновлено и сохранено в {JSON_FILE}.")
 
 scheduler.every().day.at("10:00").do(update_lesson)
 scheduler.every().day.at("22:00").do(update_lesson)
 
 if __name__ == "__main__":
+    start_metrics_server(SCRAPER_METRICS_PORT)
     update_lesson()
     while True:
         scheduler.run_pending()
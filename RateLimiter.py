@@ -0,0 +1,149 @@
+import asyncio
+import heapq
+import itertools
+import time as time_module
+
+API_RATE = 20
+API_BURST = 20
+PEER_RATE = 8 / 180
+PEER_BURST = 8
+MESSAGE_LIMIT = 4096
+PRIORITY_REMINDER = 0
+PRIORITY_QUERY = 1
+BUCKETS_PRUNE_SIZE = 1024
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time_module.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        while True:
+            now = time_module.monotonic()
+            delay = self.wait_time(now)
+            if not delay:
+                self.take(now)
+                return
+            await asyncio.sleep(delay)
+
+
+class OutgoingMessage:
+    __slots__ = ('peer_ids', 'text', 'priority')
+
+    def __init__(self, peer_ids: tuple, text: str, priority: int):
+        self.peer_ids = peer_ids
+        self.text = text
+        self.priority = priority
+
+
+class OutboundQueue:
+    def __init__(self, send_callback, api_bucket: TokenBucket, peer_rate: float = PEER_RATE,
+                 peer_burst: float = PEER_BURST):
+        self.send_callback = send_callback
+        self.api_bucket = api_bucket
+        self.peer_rate = peer_rate
+        self.peer_burst = peer_burst
+        self._queue = []
+        self._deferred = []
+        self._pending = {}
+        self._peer_buckets = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._queue) + len(self._deferred)
+
+    def put(self, peer_ids, text: str, priority: int = PRIORITY_QUERY):
+        peer_ids = tuple(peer_ids) if isinstance(peer_ids, (list, tuple)) else (peer_ids,)
+
+        if len(peer_ids) == 1:
+            # Ещё не отправленный ответ тому же чату дополняется, а не ставится в очередь отдельно.
+            pending = self._pending.get(peer_ids[0])
+            if pending is not None and pending.priority == priority:
+                if pending.text == text:
+                    return
+                merged_text = pending.text + "\n\n" + text
+                if len(merged_text) <= MESSAGE_LIMIT:
+                    pending.text = merged_text
+                    return
+
+        message = OutgoingMessage(peer_ids, text, priority)
+        heapq.heappush(self._queue, (priority, next(self._counter), message))
+        if len(peer_ids) == 1:
+            self._pending[peer_ids[0]] = message
+        self._wakeup.set()
+
+    def _peer_bucket(self, peer_id) -> TokenBucket:
+        bucket = self._peer_buckets.get(peer_id)
+        if bucket is None:
+            bucket = self._peer_buckets[peer_id] = TokenBucket(self.peer_rate, self.peer_burst)
+        return bucket
+
+    def _prune_buckets(self, now: float):
+        if len(self._peer_buckets) < BUCKETS_PRUNE_SIZE:
+            return
+        for peer_id in [peer_id for peer_id, bucket in self._peer_buckets.items() if bucket.is_full(now)]:
+            del self._peer_buckets[peer_id]
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            now = time_module.monotonic()
+            while self._deferred and self._deferred[0][0] <= now:
+                _, priority, order, message = heapq.heappop(self._deferred)
+                heapq.heappush(self._queue, (priority, order, message))
+
+            if not self._queue:
+                timeout = self._deferred[0][0] - now if self._deferred else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            priority, order, message = heapq.heappop(self._queue)
+            waits = {peer_id: self._peer_bucket(peer_id).wait_time(now) for peer_id in message.peer_ids}
+            throttled = tuple(peer_id for peer_id in message.peer_ids if waits[peer_id])
+            if throttled:
+                # Рассылка уходит сразу тем чатам, у которых есть лимит; остальные ждут отдельно.
+                ready = tuple(peer_id for peer_id in message.peer_ids if not waits[peer_id])
+                deferred = message if not ready else OutgoingMessage(throttled, message.text, priority)
+                peer_wait = min(waits[peer_id] for peer_id in throttled)
+                heapq.heappush(self._deferred, (now + peer_wait, priority, order, deferred))
+                if not ready:
+                    continue
+                message = OutgoingMessage(ready, message.text, priority)
+
+            for peer_id in message.peer_ids:
+                self._peer_bucket(peer_id).take(now)
+                if self._pending.get(peer_id) is message:
+                    del self._pending[peer_id]
+
+            await self.api_bucket.acquire()
+            peer_ids = list(message.peer_ids) if len(message.peer_ids) > 1 else message.peer_ids[0]
+            try:
+                await self.send_callback(peer_ids, message.text)
+            except Exception as error:
+                print(f"Не удалось отправить сообщение {peer_ids}: {error!r}")
+            self._prune_buckets(now)
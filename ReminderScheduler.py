@@ -0,0 +1,164 @@
+import asyncio
+import heapq
+import itertools
+from datetime import datetime
+from ScheduleStore import LessonRecord
+
+MAX_SLEEP = 300
+STATE_SECTION = 'reminders'
+MISSED_POLICY_SEND = 'send'
+MISSED_POLICY_UPCOMING = 'upcoming'
+MISSED_POLICY_DROP = 'drop'
+# Что делать с напоминаниями, срок которых прошёл, пока бот был выключен:
+# отправить все, отправить только о ещё не начавшихся парах или удалить.
+MISSED_REMINDER_POLICY = MISSED_POLICY_UPCOMING
+
+
+def encode_reminder(reminder: dict) -> dict:
+    lesson = reminder["lesson"]
+    return {
+        "time": reminder["time"].isoformat(),
+        "lesson": dict(lesson.to_dict(), group=lesson.group),
+        "minutes_before": reminder["minutes_before"],
+        "peer_id": reminder["peer_id"],
+        "subscription": reminder.get("subscription", False),
+    }
+
+
+def decode_reminder(data: dict) -> dict:
+    return {
+        "time": datetime.fromisoformat(data["time"]),
+        "lesson": LessonRecord.from_dict(data["lesson"]["group"], data["lesson"]),
+        "minutes_before": data["minutes_before"],
+        "peer_id": data["peer_id"],
+        "subscription": data.get("subscription", False),
+    }
+
+
+class ReminderScheduler:
+    def __init__(self, state, missed_policy: str = MISSED_REMINDER_POLICY):
+        self.state = state
+        self._heap = []
+        self._reminders = {}
+        self._entries = {}
+        self._by_peer = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._restore(missed_policy)
+
+    def _restore(self, missed_policy: str):
+        now = datetime.now()
+        missed = []
+        for key, data in self.state.items(STATE_SECTION):
+            try:
+                reminder = decode_reminder(data)
+            except (KeyError, TypeError, ValueError):
+                missed.append(key)
+                continue
+            if reminder["time"] <= now and (
+                    missed_policy == MISSED_POLICY_DROP or
+                    missed_policy == MISSED_POLICY_UPCOMING and reminder["lesson"].start_datetime <= now):
+                missed.append(key)
+                continue
+            self._heap.append((reminder["time"], self._insert(key, reminder), key))
+
+        # Куча строится один раз, а не по одному элементу.
+        heapq.heapify(self._heap)
+        for key in missed:
+            self.state.delete(STATE_SECTION, key)
+        self.state.flush()
+        if missed:
+            print(f"Пропущено напоминаний за время простоя: {len(missed)}")
+
+    def __len__(self) -> int:
+        return len(self._reminders)
+
+    def __contains__(self, key) -> bool:
+        return key in self._reminders
+
+    def get(self, key):
+        return self._reminders.get(key)
+
+    def items(self):
+        return self._reminders.items()
+
+    def _insert(self, key, reminder: dict) -> int:
+        entry = next(self._counter)
+        self._reminders[key] = reminder
+        self._entries[key] = entry
+        self._by_peer.setdefault(reminder["peer_id"], set()).add(key)
+        return entry
+
+    def add(self, key, reminder: dict):
+        self._remove(key)
+        entry = self._insert(key, reminder)
+        heapq.heappush(self._heap, (reminder["time"], entry, key))
+        self.state.put(STATE_SECTION, key, encode_reminder(reminder))
+        self.state.flush()
+        if self._heap[0][1] == entry:
+            self._wakeup.set()
+
+    def discard(self, key):
+        reminder = self._remove(key)
+        self.state.flush()
+        return reminder
+
+    def _remove(self, key):
+        reminder = self._reminders.pop(key, None)
+        if reminder is None:
+            return None
+        del self._entries[key]
+        self.state.delete(STATE_SECTION, key)
+        peer_keys = self._by_peer[reminder["peer_id"]]
+        peer_keys.discard(key)
+        if not peer_keys:
+            del self._by_peer[reminder["peer_id"]]
+        # Запись в куче остаётся и пропускается при извлечении.
+        if len(self._heap) > 2 * len(self._reminders) + 64:
+            self._compact()
+        return reminder
+
+    def cancel_peer(self, peer_id) -> list[dict]:
+        cancelled = [self._remove(key) for key in list(self._by_peer.get(peer_id, ()))]
+        self.state.flush()
+        return cancelled
+
+    def _compact(self):
+        self._heap = [item for item in self._heap if self._entries.get(item[2]) == item[1]]
+        heapq.heapify(self._heap)
+
+    def _is_current(self, item) -> bool:
+        return self._entries.get(item[2]) == item[1]
+
+    def next_time(self):
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> list[dict]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            item = heapq.heappop(self._heap)
+            if self._is_current(item):
+                due.append(self._remove(item[2]))
+        self.state.flush()
+        return due
+
+    async def run(self, callback):
+        while True:
+            self._wakeup.clear()
+            due = self.pop_due(datetime.now())
+            if due:
+                try:
+                    await callback(due)
+                except Exception as error:
+                    print(f"Не удалось отправить {len(due)} напоминаний: {error!r}")
+
+            next_time = self.next_time()
+            timeout = MAX_SLEEP
+            if next_time is not None:
+                timeout = min(max((next_time - datetime.now()).total_seconds(), 0), MAX_SLEEP)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
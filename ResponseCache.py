@@ -0,0 +1,31 @@
+from datetime import date
+
+
+class ResponseCache:
+    def __init__(self):
+        self._entries = {}
+        self._generation = None
+        self._day = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_build(self, generation, key, build) -> list[str]:
+        today = date.today()
+        if generation != self._generation or today != self._day:
+            self._entries.clear()
+            self._generation = generation
+            self._day = today
+
+        chunks = self._entries.get(key)
+        if chunks is None:
+            self.misses += 1
+            chunks = self._entries[key] = build()
+        else:
+            self.hits += 1
+        return chunks
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
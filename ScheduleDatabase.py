@@ -0,0 +1,113 @@
+import pathlib
+import re
+import sqlite3
+from datetime import date, datetime
+from ScheduleStore import LessonRecord
+
+DB_FILE = 'univBase.db'
+ROOM_REGEX = re.compile(r'(\d+[а-яА-Я]?)\s*ауд\.')
+LESSON_COLUMNS = "group_name, date, start, end, subject, teacher, location, building, week"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lessons (
+    group_name TEXT NOT NULL,
+    date TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    teacher TEXT NOT NULL,
+    location TEXT NOT NULL,
+    building TEXT NOT NULL,
+    week INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lessons_by_group ON lessons (group_name, date, start);
+DROP INDEX IF EXISTS lessons_by_teacher;
+DROP INDEX IF EXISTS lessons_by_room;
+CREATE TABLE IF NOT EXISTS groups (
+    name TEXT PRIMARY KEY,
+    hash TEXT,
+    updated TEXT NOT NULL
+);
+"""
+
+
+def get_room(location: str):
+    match = ROOM_REGEX.search(location)
+    return match.group(1).lower() if match else None
+
+
+class ScheduleDatabase:
+    def __init__(self, path: str = DB_FILE, readonly: bool = True):
+        self.path = path
+        self.readonly = readonly
+        self._connection = None
+
+    def connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if self.readonly:
+                # Бот только читает: в режиме WAL запись парсера не блокирует его запросы.
+                uri = pathlib.Path(self.path).absolute().as_uri() + '?mode=ro'
+                self._connection = sqlite3.connect(uri, uri=True)
+            else:
+                connection = sqlite3.connect(self.path)
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.executescript(SCHEMA)
+                self._connection = connection
+        return self._connection
+
+    def get_group_names(self) -> set[str]:
+        return {name for name, in self.connect().execute("SELECT name FROM groups")}
+
+    def get_group_hashes(self) -> dict:
+        return dict(self.connect().execute("SELECT name, hash FROM groups"))
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _select_lessons(self, where: str, params: tuple) -> list[LessonRecord]:
+        rows = self.connect().execute(f"SELECT {LESSON_COLUMNS} FROM lessons WHERE {where}", params)
+        return [LessonRecord(group, date.fromisoformat(day), *rest) for group, day, *rest in rows]
+
+    def get_group_lessons(self, group: str) -> list[LessonRecord]:
+        return self._select_lessons("group_name = ? ORDER BY date, start", (group,))
+
+    def get_lessons_between(self, group: str, first_date: date, last_date: date) -> list[LessonRecord]:
+        return self._select_lessons(
+            "group_name = ? AND date BETWEEN ? AND ? ORDER BY date, start",
+            (group, first_date.isoformat(), last_date.isoformat()))
+
+    def get_next_lesson(self, group: str, now: datetime):
+        today = now.date().isoformat()
+        lessons = self._select_lessons(
+            "group_name = ? AND (date > ? OR (date = ? AND start > ?)) ORDER BY date, start LIMIT 1",
+            (group, today, today, now.hour * 60 + now.minute))
+        return lessons[0] if lessons else None
+
+    def get_date_range(self, group: str):
+        first_date, last_date = self.connect().execute(
+            "SELECT MIN(date), MAX(date) FROM lessons WHERE group_name = ?", (group,)).fetchone()
+        if first_date is None:
+            return None
+        return date.fromisoformat(first_date), date.fromisoformat(last_date)
+
+    def replace_groups(self, records_by_group: dict[str, list[dict]], hashes: dict, keep_groups=None):
+        connection = self.connect()
+        updated = datetime.now().isoformat(timespec='seconds')
+        # Группы заменяются целиком в одной транзакции: читатели видят либо старый семестр, либо новый.
+        with connection:
+            if keep_groups is not None:
+                stale = [name for name, in connection.execute("SELECT name FROM groups") if name not in keep_groups]
+                connection.executemany("DELETE FROM lessons WHERE group_name = ?", [(name,) for name in stale])
+                connection.executemany("DELETE FROM groups WHERE name = ?", [(name,) for name in stale])
+
+            for group, records in records_by_group.items():
+                connection.execute("DELETE FROM lessons WHERE group_name = ?", (group,))
+                connection.executemany(
+                    f"INSERT INTO lessons ({LESSON_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(group, record["date"], record["start"], record["end"], record["subject"], record["teacher"],
+                      record["location"], record["building"], record["week"])
+                     for record in records])
+                connection.execute(
+                    "INSERT OR REPLACE INTO groups (name, hash, updated) VALUES (?, ?, ?)",
+                    (group, hashes.get(group), updated))
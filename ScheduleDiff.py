@@ -0,0 +1,109 @@
+from datetime import date, timedelta
+
+CHANGE_ADDED = 'added'
+CHANGE_REMOVED = 'removed'
+CHANGE_CHANGED = 'changed'
+CHANGE_MOVED = 'moved'
+COMPARED_FIELDS = ('subject', 'teacher', 'location', 'building', 'end')
+
+
+def get_covered_dates(weeks: dict) -> set[str]:
+    covered = set()
+    for start in weeks.values():
+        start_date = date.fromisoformat(start)
+        covered.update((start_date + timedelta(days=i)).isoformat() for i in range(7))
+    return covered
+
+
+def get_slot(lesson: dict) -> tuple:
+    return lesson['date'], lesson['start']
+
+
+def get_changed_fields(old_lesson: dict, new_lesson: dict) -> list[str]:
+    return [field for field in COMPARED_FIELDS if old_lesson[field] != new_lesson[field]]
+
+
+def find_same_lesson(slot: list[dict], lesson: dict):
+    for index, old_lesson in enumerate(slot):
+        if not get_changed_fields(old_lesson, lesson):
+            return index
+    return None
+
+
+def get_change_sort_key(change: dict) -> tuple:
+    lesson = change['new'] or change['old']
+    return get_slot(lesson)
+
+
+def diff_group(old_group: dict, new_group: dict) -> list[dict]:
+    # Сравниваются только дни, которые есть в обеих версиях: сдвиг окна недель изменением не считается.
+    covered = get_covered_dates(old_group.get('weeks', {})) & get_covered_dates(new_group.get('weeks', {}))
+    if not covered:
+        return []
+
+    old_by_slot = {}
+    for lesson in old_group['lessons']:
+        if lesson['date'] in covered:
+            old_by_slot.setdefault(get_slot(lesson), []).append(lesson)
+
+    # В одном слоте могут стоять пары подгрупп, поэтому сначала снимаются пары без изменений в COMPARED_FIELDS.
+    unmatched = []
+    for lesson in new_group['lessons']:
+        if lesson['date'] not in covered:
+            continue
+        slot = old_by_slot.get(get_slot(lesson))
+        index = find_same_lesson(slot, lesson) if slot else None
+        if index is not None:
+            slot.pop(index)
+        else:
+            unmatched.append(lesson)
+
+    changes = []
+    added = []
+    for lesson in unmatched:
+        slot = old_by_slot.get(get_slot(lesson))
+        if slot:
+            changes.append({"type": CHANGE_CHANGED, "old": slot.pop(0), "new": lesson})
+        else:
+            added.append(lesson)
+
+    # Пара, которая пропала из одного слота и появилась в другом, считается перенесённой.
+    removed_by_subject = {}
+    for slot in old_by_slot.values():
+        for lesson in slot:
+            removed_by_subject.setdefault((lesson['subject'], lesson['teacher']), []).append(lesson)
+
+    for lesson in added:
+        candidates = removed_by_subject.get((lesson['subject'], lesson['teacher']))
+        if candidates:
+            changes.append({"type": CHANGE_MOVED, "old": candidates.pop(0), "new": lesson})
+        else:
+            changes.append({"type": CHANGE_ADDED, "old": None, "new": lesson})
+
+    for candidates in removed_by_subject.values():
+        changes.extend({"type": CHANGE_REMOVED, "old": lesson, "new": None} for lesson in candidates)
+
+    changes.sort(key=get_change_sort_key)
+    return changes
+
+
+def diff_snapshots(old_snapshot, new_snapshot) -> dict[str, list[dict]]:
+    changes = new_snapshot.changes
+    if changes is not None and changes.get('from_generation') == old_snapshot.generation:
+        return changes['groups']
+
+    # Промежуточные версии бот пропустил, поэтому снимки сравниваются заново.
+    changes_by_group = {}
+    for name, new_group in new_snapshot.groups.items():
+        old_group = old_snapshot.groups.get(name)
+        if old_group is None or (new_group.content_hash and old_group.content_hash == new_group.content_hash):
+            continue
+        group_changes = diff_group(old_group.to_dict(), new_group.to_dict())
+        if group_changes:
+            changes_by_group[name] = group_changes
+    return changes_by_group
+
+
+def is_change_within(change: dict, first_date: date, last_date: date) -> bool:
+    first, last = first_date.isoformat(), last_date.isoformat()
+    return any(lesson is not None and first <= lesson['date'] <= last for lesson in (change['old'], change['new']))
@@ -0,0 +1,116 @@
+from datetime import date
+from functools import lru_cache
+from ScheduleStore import GroupSchedule, LessonRecord
+from RateLimiter import MESSAGE_LIMIT
+from ScheduleDiff import CHANGE_ADDED, CHANGE_MOVED, CHANGE_REMOVED, get_changed_fields
+
+SHORT_WEEKDAYS = ('Пн.', 'Вт.', 'Ср.', 'Чт.', 'Пт.', 'Сб.', 'Вс.')
+CHANGED_FIELD_TITLES = {
+    'subject': "предмет",
+    'teacher': "преподаватель",
+    'location': "аудитория",
+    'building': "корпус",
+    'end': "окончание",
+}
+WEEK_TITLES = {
+    1: "Расписание на первую неделю:\n\n",
+    2: "Расписание на вторую неделю:\n\n",
+}
+
+
+def format_date_header(lesson_date: date) -> str:
+    return f"{lesson_date.strftime('%d.%m.%Y')} | {SHORT_WEEKDAYS[lesson_date.weekday()]}\n"
+
+
+@lru_cache(maxsize=4096)
+def render_lesson(lesson: LessonRecord) -> str:
+    return (
+        format_date_header(lesson.date) +
+        f"[{lesson.start_time.strftime('%H:%M')} - {lesson.end_time.strftime('%H:%M')}]\n"
+        f"Предмет: {lesson.subject}.\n"
+        f"Преподаватель: {lesson.teacher}\n"
+        f"Аудитория: {lesson.location}\n"
+        f"Корпус: {lesson.building}\n\n"
+    )
+
+
+@lru_cache(maxsize=64)
+def render_day_off(day: date) -> str:
+    return format_date_header(day) + "Выходной! Нет ничего лучше выходных, правда?\n\n"
+
+
+def render_day(schedule: GroupSchedule, day: date) -> list[str]:
+    lessons = schedule.get_lessons_on(day)
+    if lessons:
+        return [render_lesson(lesson) for lesson in lessons]
+    if schedule.get_week_of(day) is not None:
+        return [render_day_off(day)]
+    return []
+
+
+def render_week(schedule: GroupSchedule, week: int) -> list[str]:
+    week_dates = schedule.get_week_dates(week)
+    if not week_dates:
+        return []
+    rendered = [WEEK_TITLES[week]]
+    for day in week_dates:
+        rendered.extend(render_day(schedule, day))
+    return rendered
+
+
+def render_search_results(title: str, results: list[tuple]) -> str:
+    rendered = [title]
+    for lesson, groups in results:
+        rendered.append(render_lesson(lesson).rstrip('\n') + f"\nГруппы: {', '.join(groups)}\n\n")
+    return "\n".join(rendered)
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def format_field(field: str, value) -> str:
+    return format_minutes(value) if field == 'end' else str(value)
+
+
+def format_slot(lesson: dict) -> str:
+    return f"{date.fromisoformat(lesson['date']).strftime('%d.%m')} {format_minutes(lesson['start'])}"
+
+
+def render_change(change: dict) -> str:
+    old, new = change['old'], change['new']
+    if change['type'] == CHANGE_ADDED:
+        return f"{format_slot(new)} {new['subject']}: новая пара, аудитория {new['location']}"
+    if change['type'] == CHANGE_REMOVED:
+        return f"{format_slot(old)} {old['subject']}: пара отменена"
+
+    changed_fields = get_changed_fields(old, new)
+    if change['type'] == CHANGE_MOVED:
+        # Конец перенесённой пары сдвигается вместе с началом, поэтому сравнивается длительность.
+        details = [f"{CHANGED_FIELD_TITLES[field]} {old[field]} → {new[field]}"
+                   for field in changed_fields if field != 'end']
+        old_duration, new_duration = old['end'] - old['start'], new['end'] - new['start']
+        if old_duration != new_duration:
+            details.append(f"длительность {old_duration} → {new_duration} мин")
+        details.insert(0, f"перенесена с {format_slot(old)} на {format_slot(new)}")
+        return f"{new['subject']}: " + "; ".join(details)
+
+    details = [f"{CHANGED_FIELD_TITLES[field]} {format_field(field, old[field])} → {format_field(field, new[field])}"
+               for field in changed_fields]
+    return f"{format_slot(new)} {new['subject']}: " + "; ".join(details)
+
+
+def render_changes(group: str, changes: list[dict]) -> str:
+    return f"Изменения в расписании группы {group}:\n\n" + "\n".join(render_change(change) for change in changes)
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> list[str]:
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    chunks.append(text)
+    return chunks
@@ -0,0 +1,206 @@
+import bisect
+import heapq
+import itertools
+import re
+from datetime import datetime
+from ScheduleDatabase import get_room
+
+TOKEN_REGEX = re.compile(r'[0-9a-zа-я]+')
+FIELDS = ('teacher', 'room', 'subject')
+MIN_FUZZY_LENGTH = 4
+SEARCH_LIMIT = 8
+
+
+def normalize(text: str) -> str:
+    return text.lower().replace('ё', 'е')
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_REGEX.findall(normalize(text))
+
+
+def get_field_tokens(lesson, field: str) -> set[str]:
+    if field == 'room':
+        room = get_room(lesson.location)
+        return {room} if room else set()
+    return set(tokenize(getattr(lesson, field)))
+
+
+def get_minute_key(day, minutes: int) -> int:
+    return day.toordinal() * 1440 + minutes
+
+
+def get_variants(token: str) -> set[str]:
+    # Слово и все его варианты без одной буквы: совпадение вариантов даёт кандидатов на опечатку.
+    return {token} | {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def is_one_edit_away(first: str, second: str) -> bool:
+    if first == second:
+        return True
+    if abs(len(first) - len(second)) > 1:
+        return False
+    if len(first) > len(second):
+        first, second = second, first
+
+    i = 0
+    while i < len(first) and first[i] == second[i]:
+        i += 1
+    if len(first) < len(second):
+        return first[i:] == second[i + 1:]
+    if first[i + 1:] == second[i + 1:]:
+        return True
+    # Переставленные соседние буквы.
+    return (i + 1 < len(first) and first[i] == second[i + 1] and first[i + 1] == second[i]
+            and first[i + 2:] == second[i + 2:])
+
+
+class FieldIndex:
+    def __init__(self, prefer_exact: bool = False):
+        self.prefer_exact = prefer_exact
+        self.postings = {}
+        self.variants = {}
+        self._sorted_tokens = None
+
+    def add(self, token: str, lesson_id: int):
+        lesson_ids = self.postings.get(token)
+        if lesson_ids is None:
+            lesson_ids = self.postings[token] = set()
+            self._sorted_tokens = None
+            for variant in get_variants(token):
+                self.variants.setdefault(variant, set()).add(token)
+        lesson_ids.add(lesson_id)
+
+    def remove(self, token: str, lesson_id: int):
+        lesson_ids = self.postings.get(token)
+        if lesson_ids is None:
+            return
+        lesson_ids.discard(lesson_id)
+        if lesson_ids:
+            return
+        del self.postings[token]
+        self._sorted_tokens = None
+        for variant in get_variants(token):
+            tokens = self.variants[variant]
+            tokens.discard(token)
+            if not tokens:
+                del self.variants[variant]
+
+    def match_prefix(self, prefix: str) -> list[str]:
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self.postings)
+        start = bisect.bisect_left(self._sorted_tokens, prefix)
+        end = bisect.bisect_left(self._sorted_tokens, prefix + '\uffff', start)
+        return self._sorted_tokens[start:end]
+
+    def match_fuzzy(self, token: str) -> list[str]:
+        candidates = set()
+        for variant in get_variants(token):
+            candidates.update(self.variants.get(variant, ()))
+        return [candidate for candidate in candidates if is_one_edit_away(token, candidate)]
+
+    def lookup(self, token: str) -> set[int]:
+        # Инициалы ищутся точно, иначе одна буква совпадёт с половиной словаря.
+        # Номер аудитории тоже: "ба 40" — это аудитория 40, а не все с 400 по 409.
+        if len(token) == 1 or (self.prefer_exact and token in self.postings):
+            tokens = [token] if token in self.postings else []
+        else:
+            tokens = self.match_prefix(token)
+            if not tokens and len(token) >= MIN_FUZZY_LENGTH:
+                tokens = self.match_fuzzy(token)
+
+        lesson_ids = set()
+        for matched in tokens:
+            lesson_ids.update(self.postings[matched])
+        return lesson_ids
+
+
+class LessonIndex:
+    # Пара, общая для нескольких групп (поток на лекции), хранится одной записью со множеством групп.
+    def __init__(self):
+        self.fields = {field: FieldIndex(prefer_exact=field == 'room') for field in FIELDS}
+        self.lessons = {}
+        self.lesson_groups = {}
+        self.start_keys = {}
+        self.end_keys = {}
+        self.group_hashes = {}
+        self._lesson_ids = {}
+        self._group_lessons = {}
+        self._ids = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.lessons)
+
+    @staticmethod
+    def get_lesson_key(lesson) -> tuple:
+        return lesson.date, lesson.start, lesson.end, lesson.subject, lesson.teacher, lesson.location
+
+    def _add_lesson(self, lesson) -> int:
+        key = self.get_lesson_key(lesson)
+        lesson_id = self._lesson_ids.get(key)
+        if lesson_id is None:
+            lesson_id = self._lesson_ids[key] = next(self._ids)
+            self.lessons[lesson_id] = lesson
+            self.lesson_groups[lesson_id] = set()
+            self.start_keys[lesson_id] = get_minute_key(lesson.date, lesson.start)
+            self.end_keys[lesson_id] = get_minute_key(lesson.date, lesson.end)
+            for field, field_index in self.fields.items():
+                for token in get_field_tokens(lesson, field):
+                    field_index.add(token, lesson_id)
+        self.lesson_groups[lesson_id].add(lesson.group)
+        return lesson_id
+
+    def _remove_lesson(self, lesson_id: int, group: str):
+        groups = self.lesson_groups[lesson_id]
+        groups.discard(group)
+        if groups:
+            return
+        lesson = self.lessons.pop(lesson_id)
+        del self.lesson_groups[lesson_id], self.start_keys[lesson_id], self.end_keys[lesson_id]
+        del self._lesson_ids[self.get_lesson_key(lesson)]
+        for field, field_index in self.fields.items():
+            for token in get_field_tokens(lesson, field):
+                field_index.remove(token, lesson_id)
+
+    def add_group(self, group: str, content_hash, lessons):
+        self.remove_group(group)
+        self._group_lessons[group] = {self._add_lesson(lesson) for lesson in lessons}
+        self.group_hashes[group] = content_hash
+
+    def remove_group(self, group: str):
+        for lesson_id in self._group_lessons.pop(group, ()):
+            self._remove_lesson(lesson_id, group)
+        self.group_hashes.pop(group, None)
+
+    def sync(self, hashes: dict, load_lessons) -> int:
+        # Переиндексируются только группы, у которых изменился хэш расписания.
+        for group in [group for group in self.group_hashes if group not in hashes]:
+            self.remove_group(group)
+
+        updated = 0
+        for group, content_hash in hashes.items():
+            if group in self.group_hashes and self.group_hashes[group] == content_hash:
+                continue
+            self.add_group(group, content_hash, load_lessons(group))
+            updated += 1
+        return updated
+
+    def search(self, field: str, query: str, after: datetime = None, group: str = None,
+               limit: int = SEARCH_LIMIT) -> list[tuple]:
+        tokens = tokenize(query)
+        if field == 'room':
+            tokens = [token for token in tokens if token[0].isdigit()]
+        if not tokens:
+            return []
+
+        field_index = self.fields[field]
+        id_sets = sorted((field_index.lookup(token) for token in tokens), key=len)
+        lesson_ids = id_sets[0].intersection(*id_sets[1:])
+        if after is not None:
+            after_key = get_minute_key(after.date(), after.hour * 60 + after.minute)
+            lesson_ids = [lesson_id for lesson_id in lesson_ids if self.end_keys[lesson_id] > after_key]
+        if group is not None:
+            lesson_ids = [lesson_id for lesson_id in lesson_ids if group in self.lesson_groups[lesson_id]]
+
+        lesson_ids = heapq.nsmallest(limit, lesson_ids, key=self.start_keys.__getitem__)
+        return [(self.lessons[lesson_id], sorted(self.lesson_groups[lesson_id])) for lesson_id in lesson_ids]
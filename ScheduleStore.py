@@ -0,0 +1,244 @@
+import asyncio
+import bisect
+import dataclasses
+import json
+import os
+import socket
+import threading
+import time as time_module
+from datetime import date, datetime, time, timedelta
+from Metrics import registry
+
+JSON_FILE = 'univBase.json'
+SCHEMA_VERSION = 2
+CHECK_INTERVAL = 10.0
+DEFAULT_GROUP = None
+NOTIFY_HOST = '127.0.0.1'
+NOTIFY_PORT = 9103
+NOTIFY_MESSAGE = b'reload'
+
+reload_latency = registry.histogram('univbot_schedule_reload_seconds', "Время загрузки расписания из файла.")
+reload_failures = registry.counter('univbot_schedule_reload_failures_total', "Неудачные загрузки расписания.")
+reload_notifications = registry.counter(
+    'univbot_schedule_reload_notifications_total', "Уведомления парсера о новом расписании.")
+
+
+@dataclasses.dataclass(frozen=True)
+class LessonRecord:
+    group: str
+    date: date
+    start: int
+    end: int
+    subject: str
+    teacher: str
+    location: str
+    building: str
+    week: int
+
+    @classmethod
+    def from_dict(cls, group: str, data: dict) -> 'LessonRecord':
+        return cls(
+            group=group,
+            date=date.fromisoformat(data['date']),
+            start=data['start'],
+            end=data['end'],
+            subject=data['subject'],
+            teacher=data['teacher'],
+            location=data['location'],
+            building=data['building'],
+            week=data['week'],
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "date": self.date.isoformat(),
+            "start": self.start,
+            "end": self.end,
+            "subject": self.subject,
+            "teacher": self.teacher,
+            "location": self.location,
+            "building": self.building,
+            "week": self.week,
+        }
+
+    @property
+    def start_time(self) -> time:
+        return time(self.start // 60, self.start % 60)
+
+    @property
+    def end_time(self) -> time:
+        return time(self.end // 60, self.end % 60)
+
+    @property
+    def start_datetime(self) -> datetime:
+        return datetime.combine(self.date, self.start_time)
+
+    @property
+    def end_datetime(self) -> datetime:
+        return datetime.combine(self.date, self.end_time)
+
+
+class GroupSchedule:
+    def __init__(self, name: str, data: dict):
+        self.name = name
+        self.content_hash = data.get('hash')
+        self.weeks = {int(week): date.fromisoformat(start) for week, start in data['weeks'].items()}
+        self.lessons = sorted(
+            (LessonRecord.from_dict(name, lesson) for lesson in data['lessons']),
+            key=lambda lesson: (lesson.date, lesson.start),
+        )
+        self.by_date = {}
+        for lesson in self.lessons:
+            self.by_date.setdefault(lesson.date, []).append(lesson)
+
+    def to_dict(self) -> dict:
+        return {
+            "weeks": {str(week): start_date.isoformat() for week, start_date in self.weeks.items()},
+            "lessons": [lesson.to_dict() for lesson in self.lessons],
+        }
+
+    def get_next_lesson(self, after: datetime):
+        index = bisect.bisect_right(self.lessons, after, key=lambda lesson: lesson.start_datetime)
+        return self.lessons[index] if index < len(self.lessons) else None
+
+    def get_lessons_on(self, target_date: date) -> list[LessonRecord]:
+        return self.by_date.get(target_date, [])
+
+    def get_week_dates(self, week: int) -> list[date]:
+        start_date = self.weeks.get(week)
+        if start_date is None:
+            return []
+        return [start_date + timedelta(days=i) for i in range(7)]
+
+    def get_week_of(self, target_date: date):
+        for week, start_date in self.weeks.items():
+            if start_date <= target_date < start_date + timedelta(days=7):
+                return week
+        return None
+
+
+class ScheduleSnapshot:
+    def __init__(self, data: dict, mtime: int):
+        if data.get('version') != SCHEMA_VERSION:
+            raise ValueError(f"Неподдерживаемая версия {JSON_FILE}: {data.get('version')}, перезапустите ParsingSite.py")
+        self.mtime = mtime
+        # Файлы без номера версии (старые или правленные вручную) различаются по времени изменения.
+        self.generation = data.get('generation', mtime)
+        self.changes = data.get('changes')
+        self.groups = {name: GroupSchedule(name, group_data) for name, group_data in data['groups'].items()}
+
+    def group(self, name: str = None):
+        name = name or DEFAULT_GROUP
+        if name is None:
+            return next(iter(self.groups.values()), None)
+        return self.groups.get(name)
+
+
+class ScheduleStore:
+    def __init__(self, path: str = JSON_FILE):
+        self.path = path
+        self._snapshot = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._reload_thread = None
+        self._listeners = []
+        self._loop = None
+
+    def on_change(self, listener):
+        self._listeners.append(listener)
+        return listener
+
+    def _notify_listeners(self, old_snapshot: ScheduleSnapshot, new_snapshot: ScheduleSnapshot):
+        # Перезагрузка идёт в отдельном потоке, а слушатели работают в цикле событий бота.
+        if self._loop is None or self._loop.is_closed():
+            return
+        for listener in self._listeners:
+            asyncio.run_coroutine_threadsafe(listener(old_snapshot, new_snapshot), self._loop)
+
+    def get(self) -> ScheduleSnapshot:
+        if self._snapshot is None:
+            self.reload()
+            return self._snapshot
+
+        now = time_module.monotonic()
+        if now - self._last_check >= CHECK_INTERVAL:
+            self._last_check = now
+            self._reload_in_background()
+        return self._snapshot
+
+    def _reload_in_background(self):
+        # Читатели не ждут разбора файла: до подмены они получают прежний снимок.
+        if self._reload_thread is not None and self._reload_thread.is_alive():
+            return
+        self._reload_thread = threading.Thread(target=self.reload, name='schedule-reload', daemon=True)
+        self._reload_thread.start()
+
+    def reload(self, force: bool = False) -> bool:
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                if self._snapshot is None:
+                    raise
+                return False
+
+            if not force and self._snapshot is not None and self._snapshot.mtime == mtime:
+                return False
+
+            started = time_module.perf_counter()
+            try:
+                with open(self.path, 'r', encoding='utf-8') as file:
+                    snapshot = ScheduleSnapshot(json.load(file), mtime)
+            except (OSError, ValueError, KeyError):
+                reload_failures.inc()
+                # Файл может быть недописан парсером: оставляем предыдущую версию.
+                if self._snapshot is None:
+                    raise
+                return False
+
+            previous, self._snapshot = self._snapshot, snapshot
+            reload_latency.observe(time_module.perf_counter() - started)
+            if previous is not None:
+                self._notify_listeners(previous, snapshot)
+            return True
+
+    def reload_on_notification(self):
+        print("Обновление расписания...")
+        try:
+            self.reload()
+        except Exception as error:
+            print(f"Не удалось обновить расписание: {error!r}")
+
+    async def listen(self, host: str = NOTIFY_HOST, port: int = NOTIFY_PORT):
+        # Без уведомлений расписание всё равно подхватится по времени изменения файла в get().
+        loop = self._loop = asyncio.get_running_loop()
+        try:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: ReloadNotificationProtocol(self), local_addr=(host, port))
+        except OSError as error:
+            print(f"Не удалось слушать уведомления об обновлении расписания на {host}:{port}: {error}")
+            return None
+        return transport
+
+
+class ReloadNotificationProtocol(asyncio.DatagramProtocol):
+    def __init__(self, store: ScheduleStore):
+        self.store = store
+
+    def datagram_received(self, data: bytes, addr):
+        if data != NOTIFY_MESSAGE:
+            return
+        reload_notifications.inc()
+        # Разбор файла идёт в потоке, новый снимок подменяется целиком.
+        asyncio.get_running_loop().run_in_executor(None, self.store.reload_on_notification)
+
+
+def notify_schedule_updated(host: str = NOTIFY_HOST, port: int = NOTIFY_PORT):
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(NOTIFY_MESSAGE, (host, port))
+    except OSError as error:
+        print(f"Не удалось уведомить бота об обновлении расписания: {error}")
+
+
+schedule_store = ScheduleStore()
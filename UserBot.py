@@ -1,23 +1,63 @@
+from vkbottle import API
 from vkbottle.bot import Bot
 import asyncio
 import nest_asyncio
-from datetime import datetime, timedelta
-import json
+from datetime import date, datetime, timedelta
 import os
-
-bot = Bot("token")
-AUTHORIZED_USER_IDS = ["user_id"]
-bot_enabled = True
-message_count = 0
-last_reset_time = datetime.now()
-reminders = {}
-last_command_time = {}
+import sqlite3
+import time as time_module
+from ScheduleStore import LessonRecord, schedule_store
+from ScheduleRender import (render_changes, render_day, render_day_off, render_lesson, render_search_results,
+                            render_week, split_message)
+from ScheduleDatabase import ScheduleDatabase
+from ScheduleDiff import diff_snapshots, is_change_within
+from ScheduleSearch import LessonIndex
+from ResponseCache import ResponseCache
+from ReminderScheduler import ReminderScheduler
+from BotState import BotState
+from DeletionQueue import DeletionQueue
+from CommandDispatcher import CommandDispatcher, DebounceCache
+from RateLimiter import API_BURST, API_RATE, PRIORITY_QUERY, PRIORITY_REMINDER, OutboundQueue, TokenBucket
+from Metrics import registry, start_metrics_server
+
+command_latency = registry.histogram(
+    'univbot_command_seconds', "Время обработки команды.", ('command',))
+vk_api_calls = registry.counter('univbot_vk_api_calls_total', "Вызовы VK API.", ('method',))
+vk_api_errors = registry.counter('univbot_vk_api_errors_total', "Ошибки вызовов VK API.", ('method',))
+vk_api_latency = registry.histogram('univbot_vk_api_seconds', "Время вызова VK API.", ('method',))
+search_sync_latency = registry.histogram('univbot_search_sync_seconds', "Время обновления поискового индекса.")
+
+
+class InstrumentedAPI(API):
+    async def request(self, method, data, version=None):
+        vk_api_calls.inc(method)
+        try:
+            with vk_api_latency.time(method):
+                return await super().request(method, data, version)
+        except Exception:
+            vk_api_errors.inc(method)
+            raise
 
 
-async def reset_message_count():
-    global message_count
-    await asyncio.sleep(180)
-    message_count = 0
+bot = Bot(api=InstrumentedAPI("token"))
+AUTHORIZED_USER_IDS = ["user_id"]
+PEER_IDS_LIMIT = 100
+SUBSCRIPTIONS_SECTION = 'subscriptions'
+SETTINGS_SECTION = 'settings'
+REMINDER_SUBSCRIPTIONS_SECTION = 'reminder_subscriptions'
+CHANGE_NOTICE_DAYS = 14
+MAX_RANGE_DAYS = 14
+bot_state = BotState()
+bot_enabled = bot_state.get(SETTINGS_SECTION, 'bot_enabled', True)
+reminder_scheduler = ReminderScheduler(bot_state)
+deletion_queue = DeletionQueue(bot_state)
+api_bucket = TokenBucket(API_RATE, API_BURST)
+response_cache = ResponseCache()
+commands = CommandDispatcher()
+admin_commands = CommandDispatcher()
+command_debounce = DebounceCache()
+schedule_db = ScheduleDatabase()
+search_index = LessonIndex()
 
 
 async def send_and_delete_message(peer_ids, message_text):
@@ -33,101 +73,194 @@ async def send_and_delete_message(peer_ids, message_text):
     for peer_id, result in zip(peer_ids if isinstance(peer_ids, list) else [peer_ids], response):
         conversation_message_id = result.conversation_message_id
         if conversation_message_id:
-            await asyncio.sleep(600)
-            await bot.api.messages.delete(
-                cmids=[conversation_message_id],
-                peer_id=peer_id,
-                delete_for_all=True
-            )
+            deletion_queue.add(result.peer_id or peer_id, conversation_message_id)
 
 
-async def send_message_with_limit(peer_id, text):
-    global message_count, last_reset_time
-    now = datetime.now()
+async def delete_messages(peer_id, cmids):
+    await api_bucket.acquire()
+    await bot.api.messages.delete(
+        cmids=cmids,
+        peer_id=peer_id,
+        delete_for_all=True
+    )
 
-    if (now - last_reset_time).seconds > 180:
-        message_count = 0
-        last_reset_time = now
 
-    if message_count < 8:
-        await send_and_delete_message(peer_id, text)
-        message_count += 1
+async def process_deletions():
+    await deletion_queue.run(delete_messages)
 
-        if message_count == 8:
-            await bot.api.messages.send(peer_id=peer_id, message="Мне нужно отдохнуть, отвечу через 3 минуты.", random_id=0)
-            await reset_message_count()
 
+outbound_queue = OutboundQueue(send_and_delete_message, api_bucket)
 
-def load_lessons_from_json():
-    with open('univBase.json', 'r', encoding='utf-8') as file:
-        data = json.load(file)
-        first_week_lessons = data['lessons']['first_week']
-        second_week_lessons = data['lessons']['second_week']
-        return first_week_lessons, second_week_lessons
+registry.gauge_callback('univbot_outbound_queue_depth', "Сообщения в очереди на отправку.",
+                        lambda: len(outbound_queue))
+registry.gauge_callback('univbot_reminders_pending', "Запланированные напоминания.",
+                        lambda: len(reminder_scheduler))
+registry.gauge_callback('univbot_deletions_pending', "Сообщения, ожидающие удаления.",
+                        lambda: len(deletion_queue))
+registry.gauge_callback('univbot_search_index_lessons', "Пары в поисковом индексе.",
+                        lambda: len(search_index))
+registry.gauge_callback('univbot_response_cache_hits', "Ответы, взятые из кэша.",
+                        lambda: response_cache.stats()["hits"])
+registry.gauge_callback('univbot_response_cache_misses', "Ответы, собранные заново.",
+                        lambda: response_cache.stats()["misses"])
+registry.gauge_callback('univbot_response_cache_size', "Ответы в кэше.",
+                        lambda: response_cache.stats()["size"])
 
 
-async def update_lessons_periodically():
-    while True:
-        now = datetime.now()
-        if (now.hour == 10 and now.minute == 1) or (now.hour == 20 and now.minute == 1):
-            print("Обновление расписания...")
-            load_lessons_from_json()
-        await asyncio.sleep(60)
+async def send_message_with_limit(peer_id, text, priority=PRIORITY_QUERY):
+    outbound_queue.put(peer_id, text, priority)
 
 
-def get_schedule_by_date(lessons, target_date):
-    target_date_str = target_date.strftime('%d.%m.%Y')
-    return [lesson for lesson in lessons if target_date_str in lesson]
+async def send_chunks(peer_id, chunks):
+    for chunk in chunks:
+        await send_message_with_limit(peer_id, chunk)
 
 
-def get_current_class(lessons):
-    now = datetime.now()
-    today = now.date()
-    current_lesson = None
+async def send_to_peers(peer_ids, text, priority=PRIORITY_QUERY):
+    peer_ids = list(dict.fromkeys(peer_ids))
+    for start in range(0, len(peer_ids), PEER_IDS_LIMIT):
+        chunk = peer_ids[start:start + PEER_IDS_LIMIT]
+        await send_message_with_limit(chunk if len(chunk) > 1 else chunk[0], text, priority)
 
-    for lesson in lessons:
-        lesson_date_str = lesson.split('|')[0].strip()
-        lesson_start_str = lesson.split('[')[1].split(']')[0].strip().split(' - ')[0]
-        lesson_end_str = lesson.split('[')[1].split(']')[0].strip().split(' - ')[1]
-        lesson_start = datetime.strptime(f"{lesson_date_str} {lesson_start_str}", '%d.%m.%Y %H:%M')
-        lesson_end = datetime.strptime(f"{lesson_date_str} {lesson_end_str}", '%d.%m.%Y %H:%M')
 
-        if lesson_start.date() == today and lesson_start <= now <= lesson_end:
-            current_lesson = lesson
-            break
+def get_chat_group(peer_id):
+    return bot_state.get(SUBSCRIPTIONS_SECTION, str(peer_id))
 
-    return current_lesson
 
+def get_chat_schedule(snapshot, peer_id):
+    return snapshot.group(get_chat_group(peer_id))
 
-async def set_reminder(minutes_before, peer_id, first_week_lessons, second_week_lessons):
-    today = datetime.now().date()
-    current_time = datetime.now()
-    all_lessons = first_week_lessons + second_week_lessons
 
-    today_lessons = [
-        lesson_info for lesson_info in all_lessons
-        if "Предмет:" in lesson_info and
-           datetime.strptime(lesson_info.split('|')[0].strip(), '%d.%m.%Y').date() == today and
-           datetime.strptime(f"{lesson_info.split('|')[0].strip()} {lesson_info.split('[')[1].split(' - ')[0]}",
-                             '%d.%m.%Y %H:%M') > current_time
-    ]
+def get_schedule_by_date(schedule, target_date):
+    if schedule is None:
+        return []
+    return render_day(schedule, target_date.date())
+
+
+def get_week_schedule(schedule, week):
+    if schedule is None:
+        return []
+    return render_week(schedule, week)
+
+
+def build_day_response(schedule, target_date, title, unavailable):
+    day_lessons = get_schedule_by_date(schedule, target_date)
+    return split_message(title + "\n".join(day_lessons)) if day_lessons else [unavailable]
+
+
+def build_week_response(schedule, week, unavailable):
+    week_lessons = get_week_schedule(schedule, week)
+    return split_message("\n".join(week_lessons)) if week_lessons else [unavailable]
+
+
+def get_cached_response(snapshot, schedule, command_name, target_date, build):
+    key = (schedule.name if schedule is not None else None, command_name, target_date)
+    return response_cache.get_or_build(snapshot.generation, key, build)
+
+
+def parse_user_date(text, today):
+    try:
+        parts = [int(part) for part in text.split('.')]
+        if len(parts) == 3:
+            return date(parts[2] if parts[2] >= 100 else 2000 + parts[2], parts[1], parts[0])
+        if len(parts) != 2:
+            return None
+    except ValueError:
+        return None
+
+    # Год не указан: берётся ближайшая к сегодняшнему дню дата, для 29.02 — в ближайшем високосном году.
+    candidates = []
+    # Високосный год всегда найдётся в пределах четырёх лет в любую сторону.
+    for year in range(today.year - 4, today.year + 5):
+        try:
+            candidates.append(date(year, parts[1], parts[0]))
+        except ValueError:
+            continue
+    if not candidates:
+        return None
+    return min(candidates, key=lambda day: abs((day - today).days))
+
+
+def build_date_range_response(group, first_date, last_date):
+    date_range = schedule_db.get_date_range(group)
+    lessons_by_date = {}
+    for lesson in schedule_db.get_lessons_between(group, first_date, last_date):
+        lessons_by_date.setdefault(lesson.date, []).append(lesson)
+
+    rendered = []
+    for offset in range((last_date - first_date).days + 1):
+        day = first_date + timedelta(days=offset)
+        if day in lessons_by_date:
+            rendered.extend(render_lesson(lesson) for lesson in lessons_by_date[day])
+        elif date_range is not None and date_range[0] <= day <= date_range[1]:
+            rendered.append(render_day_off(day))
+
+    if first_date == last_date:
+        title = f"Расписание на {first_date.strftime('%d.%m.%Y')}:\n\n"
+    else:
+        title = f"Расписание с {first_date.strftime('%d.%m.%Y')} по {last_date.strftime('%d.%m.%Y')}:\n\n"
+    if not rendered:
+        return [title.rstrip(":\n") + " недоступно."]
+    return split_message(title + "\n".join(rendered))
+
+
+def sync_search_index():
+    # Семестр берётся из базы, а пока её нет — из окна недель в univBase.json.
+    # Источник входит в ключ: когда появится база, группы переиндексируются на весь семестр.
+    try:
+        hashes = {name: ('db', content_hash) for name, content_hash in schedule_db.get_group_hashes().items()}
+        load_lessons = schedule_db.get_group_lessons
+    except sqlite3.Error:
+        snapshot = schedule_store.get()
+        hashes = {name: ('json', group.content_hash or snapshot.generation) for name, group in snapshot.groups.items()}
+        load_lessons = lambda name: snapshot.groups[name].lessons
+    with search_sync_latency.time():
+        return search_index.sync(hashes, load_lessons)
+
+
+async def search_lessons(peer_id, field, args, title, usage, group=None):
+    query = " ".join(args)
+    if not query:
+        await send_message_with_limit(peer_id, usage)
+        return
+    results = search_index.search(field, query, datetime.now(), group)
+    if not results:
+        await send_message_with_limit(peer_id, f"Ничего не найдено по запросу «{query}».")
+        return
+    await send_chunks(peer_id, split_message(render_search_results(f"{title} «{query}»:\n", results)))
+
+
+def get_current_class(schedule):
+    if schedule is None:
+        return None
+    now = datetime.now()
+
+    for lesson in schedule.get_lessons_on(now.date()):
+        if lesson.start_datetime <= now <= lesson.end_datetime:
+            return render_lesson(lesson)
+
+    return None
+
+
+async def set_reminder(minutes_before, peer_id, schedule):
+    current_time = datetime.now()
+    today_lessons = schedule.get_lessons_on(current_time.date()) if schedule is not None else []
+    today_lessons = [lesson for lesson in today_lessons if lesson.start_datetime > current_time]
 
     if today_lessons:
         reminders_to_set = []
-        for lesson_info in today_lessons:
-            lesson_time_str = lesson_info.split("\n")[1][1:-1].split(" - ")[0]
-            lesson_date_str = lesson_info.split('|')[0].strip()
-            lesson_time = datetime.strptime(f"{lesson_date_str} {lesson_time_str}", '%d.%m.%Y %H:%M')
-
+        for lesson in today_lessons:
+            lesson_time = lesson.start_datetime
+            lesson_info = render_lesson(lesson)
             reminder_time = lesson_time - timedelta(minutes=minutes_before)
             reminder_key = f"{peer_id}_{lesson_time.strftime('%Y%m%d%H%M')}"
 
-            reminders[reminder_key] = {
+            reminder_scheduler.add(reminder_key, {
                 "time": reminder_time,
-                "lesson_info": lesson_info,
+                "lesson": lesson,
                 "minutes_before": minutes_before,
                 "peer_id": peer_id
-            }
+            })
 
             reminders_to_set.append(f"Напоминание установлено на {reminder_time.strftime('%H:%M')} для пары:\n{lesson_info}")
 
@@ -138,143 +271,446 @@ async def set_reminder(minutes_before, peer_id, first_week_lessons, second_week_
         await send_message_with_limit(peer_id, response)
 
 
-async def cancel_reminder(peer_id):
-    reminders_to_delete = [key for key in reminders if key.startswith(str(peer_id))]
+def find_next_lesson(group, after):
+    try:
+        return schedule_db.get_next_lesson(group, after)
+    except sqlite3.Error:
+        schedule = schedule_store.get().group(group)
+        return schedule.get_next_lesson(after) if schedule is not None else None
+
+
+def get_subscription_reminder_key(peer_id):
+    return f"{peer_id}_sub"
+
+
+def schedule_subscription_reminder(peer_id, after=None):
+    # На подписку в планировщике всегда лежит одно напоминание — о ближайшей паре.
+    # Следующее вычисляется, когда это будет отправлено.
+    key = get_subscription_reminder_key(peer_id)
+    reminder_scheduler.discard(key)
+    subscription = bot_state.get(REMINDER_SUBSCRIPTIONS_SECTION, str(peer_id))
+    if subscription is None:
+        return None
+
+    minutes_before = subscription["minutes_before"]
+    earliest = datetime.now() + timedelta(minutes=minutes_before)
+    lesson = find_next_lesson(subscription["group"], max(earliest, after) if after else earliest)
+    if lesson is None:
+        return None
+
+    reminder_scheduler.add(key, {
+        "time": lesson.start_datetime - timedelta(minutes=minutes_before),
+        "lesson": lesson,
+        "minutes_before": minutes_before,
+        "peer_id": peer_id,
+        "subscription": True
+    })
+    return lesson
 
-    if reminders_to_delete:
-        for reminder_key in reminders_to_delete:
-            del reminders[reminder_key]
+
+def refresh_reminder_subscriptions(groups=None):
+    for peer_id, subscription in bot_state.items(REMINDER_SUBSCRIPTIONS_SECTION):
+        if groups is not None and subscription["group"] not in groups:
+            continue
+        if groups is None and get_subscription_reminder_key(peer_id) in reminder_scheduler:
+            continue
+        schedule_subscription_reminder(int(peer_id))
+
+
+async def subscribe_reminders(minutes_before, peer_id, schedule):
+    if schedule is None:
+        await send_message_with_limit(peer_id, "Расписание недоступно.")
+        return
+
+    bot_state.put(REMINDER_SUBSCRIPTIONS_SECTION, str(peer_id), {"group": schedule.name, "minutes_before": minutes_before})
+    bot_state.flush()
+    lesson = schedule_subscription_reminder(peer_id)
+    response = f"Напоминания за {minutes_before} минут до каждой пары группы {schedule.name} включены."
+    if lesson is not None:
+        reminder_time = lesson.start_datetime - timedelta(minutes=minutes_before)
+        response += f"\nБлижайшее: {reminder_time.strftime('%d.%m %H:%M')}, {lesson.subject}."
+    else:
+        response += "\nПредстоящих пар пока нет, напоминание появится после обновления расписания."
+    await send_message_with_limit(peer_id, response)
+
+
+async def cancel_reminder(peer_id):
+    subscribed = bot_state.get(REMINDER_SUBSCRIPTIONS_SECTION, str(peer_id)) is not None
+    if subscribed:
+        bot_state.delete(REMINDER_SUBSCRIPTIONS_SECTION, str(peer_id))
+        bot_state.flush()
+    if reminder_scheduler.cancel_peer(peer_id) or subscribed:
         response = "Все напоминания отменены."
     else:
         response = "Нет установленных напоминаний для отмены."
     await send_message_with_limit(peer_id, response)
 
 
+def render_reminder(lesson, minutes_before):
+    return f"\n!!!Напоминание!!!\n\nЧерез {minutes_before} минут начнется \n|{lesson.subject}.|\n{render_lesson(lesson)}"
+
+
+async def send_reminders(due_reminders):
+    # Одинаковые напоминания разным чатам уходят одним messages.send с несколькими peer_ids.
+    # Ошибка одной группы не должна терять остальные напоминания пачки.
+    try:
+        peers_by_text = {}
+        for reminder_data in due_reminders:
+            try:
+                response = render_reminder(reminder_data["lesson"], reminder_data["minutes_before"])
+            except Exception as error:
+                print(f"Не удалось подготовить напоминание для {reminder_data['peer_id']}: {error!r}")
+                continue
+            peers_by_text.setdefault(response, []).append(reminder_data["peer_id"])
+
+        for response, peer_ids in peers_by_text.items():
+            try:
+                await send_to_peers(peer_ids, response, PRIORITY_REMINDER)
+            except Exception as error:
+                print(f"Не удалось отправить напоминание чатам {peer_ids}: {error!r}")
+    finally:
+        # pop_due уже удалил пачку из планировщика: без этого подписка осталась бы без следующего напоминания.
+        for reminder_data in due_reminders:
+            if not reminder_data.get("subscription"):
+                continue
+            try:
+                schedule_subscription_reminder(reminder_data["peer_id"], reminder_data["lesson"].start_datetime)
+            except Exception as error:
+                print(f"Не удалось запланировать следующее напоминание для {reminder_data['peer_id']}: {error!r}")
+
+
 async def check_reminders():
-    while True:
-        current_time = datetime.now()
-        for reminder_key, reminder_data in list(reminders.items()):
-            if current_time >= reminder_data["time"]:
-                minutes_before = reminder_data["minutes_before"]
-                lesson_info = reminder_data["lesson_info"]
-                peer_id = reminder_data["peer_id"]
-                subject_line = [line for line in lesson_info.split("\n") if "Предмет:" in line][0]
-                subject = subject_line.split(": ")[1].strip()
-
-                response = f"\n!!!Напоминание!!!\n\nЧерез {minutes_before} минут начнется \n|{subject}|\n{lesson_info}"
-                await send_message_with_limit(peer_id, response)
-                del reminders[reminder_key]
-        await asyncio.sleep(60)
+    await reminder_scheduler.run(send_reminders)
 
 
-@bot.on.message()
-async def handle_commands(message):
-    global message_count, bot_enabled
-    command = message.text.lower()
-    first_week_lessons, second_week_lessons = load_lessons_from_json()
+def reschedule_reminders(changes_by_group):
+    keys_by_slot = {}
+    for key, reminder_data in reminder_scheduler.items():
+        lesson = reminder_data["lesson"]
+        keys_by_slot.setdefault((lesson.group, lesson.date.isoformat(), lesson.start), []).append(key)
+
     now = datetime.now()
+    for group, changes in changes_by_group.items():
+        for change in changes:
+            old_lesson = change["old"]
+            if old_lesson is None:
+                continue
+            for key in keys_by_slot.get((group, old_lesson["date"], old_lesson["start"]), ()):
+                reminder_data = reminder_scheduler.get(key)
+                # Напоминания подписок пересчитываются отдельно, по новому расписанию группы.
+                if reminder_data is None or reminder_data.get("subscription"):
+                    continue
+                reminder_scheduler.discard(key)
+                if change["new"] is None:
+                    continue
+                lesson = LessonRecord.from_dict(group, change["new"])
+                if lesson.start_datetime <= now:
+                    continue
+                reminder_time = max(lesson.start_datetime - timedelta(minutes=reminder_data["minutes_before"]), now)
+                reminder_key = f"{reminder_data['peer_id']}_{lesson.start_datetime.strftime('%Y%m%d%H%M')}"
+                reminder_scheduler.add(reminder_key, dict(reminder_data, time=reminder_time, lesson=lesson))
+
+
+async def notify_subscribers(changes_by_group):
+    peers_by_group = {}
+    for peer_id, group in bot_state.items(SUBSCRIPTIONS_SECTION):
+        peers_by_group.setdefault(group, []).append(int(peer_id))
+
+    today = date.today()
+    last_day = today + timedelta(days=CHANGE_NOTICE_DAYS)
+    for group, changes in changes_by_group.items():
+        peer_ids = peers_by_group.get(group)
+        if not peer_ids:
+            continue
+        upcoming = [change for change in changes if is_change_within(change, today, last_day)]
+        if not upcoming:
+            continue
+        for chunk in split_message(render_changes(group, upcoming)):
+            await send_to_peers(peer_ids, chunk)
+
+
+@schedule_store.on_change
+async def handle_schedule_change(old_snapshot, new_snapshot):
+    try:
+        changed_groups = {
+            name for name, group in new_snapshot.groups.items()
+            if name not in old_snapshot.groups or group.content_hash is None or
+            group.content_hash != old_snapshot.groups[name].content_hash
+        }
+        refresh_reminder_subscriptions(changed_groups)
+        sync_search_index()
+
+        changes_by_group = diff_snapshots(old_snapshot, new_snapshot)
+        if changes_by_group:
+            reschedule_reminders(changes_by_group)
+            await notify_subscribers(changes_by_group)
+    except Exception as error:
+        print(f"Не удалось разослать изменения расписания: {error!r}")
+
+
+@admin_commands.command("-off")
+async def shutdown_system(message, args):
+    await bot.api.messages.send(
+        peer_id=message.peer_id,
+        message="Выключение системы...",
+        random_id=0)
+    os.system('shutdown /s /t 0')
+
+
+@admin_commands.command("-srn")
+async def restart_system(message, args):
+    await bot.api.messages.send(
+        peer_id=message.peer_id,
+        message="Перезагрузка системы...",
+        random_id=0)
+    os.system("shutdown /r /t 1")
+
+
+@admin_commands.command("+deaf")
+async def disable_bot(message, args):
+    global bot_enabled
+    bot_enabled = False
+    bot_state.put(SETTINGS_SECTION, 'bot_enabled', False)
+    bot_state.flush()
+    await bot.api.messages.send(
+        peer_id=message.peer_id,
+        message="Функционал бота отключен.",
+        random_id=0
+    )
 
-    if message.from_id in AUTHORIZED_USER_IDS and message.peer_id == message.from_id:
-        if command == "-off":
-            await bot.api.messages.send(
-                peer_id=message.peer_id,
-                message="Выключение системы...",
-                random_id=0)
-            os.system('shutdown /s /t 0')
-            return
 
-        elif command == "-srn":
-            await bot.api.messages.send(
-                peer_id=message.peer_id,
-                message="Перезагрузка системы...",
-                random_id=0)
-            os.system("shutdown /r /t 1")
-            return
+@admin_commands.command("-deaf")
+async def enable_bot(message, args):
+    global bot_enabled
+    bot_enabled = True
+    bot_state.put(SETTINGS_SECTION, 'bot_enabled', True)
+    bot_state.flush()
+    await bot.api.messages.send(
+        peer_id=message.peer_id,
+        message="Функционал бота включен.",
+        random_id=0
+    )
 
-        elif command == "+deaf":
-            bot_enabled = False
-            await bot.api.messages.send(
-                peer_id=message.peer_id,
-                message="Функционал бота отключен.",
-                random_id=0
-            )
-            return
 
-        elif command == "-deaf":
-            bot_enabled = True
-            await bot.api.messages.send(
-                peer_id=message.peer_id,
-                message="Функционал бота включен.",
-                random_id=0
-            )
-            return
+@commands.command("бот расписание сегодня", "брс")
+async def today_schedule(message, args):
+    snapshot = schedule_store.get()
+    schedule = get_chat_schedule(snapshot, message.peer_id)
+    today = datetime.now()
+    chunks = get_cached_response(snapshot, schedule, "today", today.date(), lambda: build_day_response(
+        schedule, today, "Расписание на сегодня:\n\n", "Расписание на сегодня недоступно."))
+    await send_chunks(message.peer_id, chunks)
+
+
+@commands.command("бот расписание завтра", "брз")
+async def tomorrow_schedule(message, args):
+    snapshot = schedule_store.get()
+    schedule = get_chat_schedule(snapshot, message.peer_id)
+    tomorrow = datetime.now() + timedelta(days=1)
+    chunks = get_cached_response(snapshot, schedule, "tomorrow", tomorrow.date(), lambda: build_day_response(
+        schedule, tomorrow, "Расписание на завтра:\n\n", "Расписание на завтра недоступно."))
+    await send_chunks(message.peer_id, chunks)
+
+
+@commands.command("бот расписание 1 неделя", "бр1")
+async def first_week_schedule(message, args):
+    snapshot = schedule_store.get()
+    schedule = get_chat_schedule(snapshot, message.peer_id)
+    chunks = get_cached_response(snapshot, schedule, "week1", None, lambda: build_week_response(
+        schedule, 1, "Расписание на первую неделю недоступно."))
+    await send_chunks(message.peer_id, chunks)
+
+
+@commands.command("бот расписание 2 неделя", "бр2")
+async def second_week_schedule(message, args):
+    snapshot = schedule_store.get()
+    schedule = get_chat_schedule(snapshot, message.peer_id)
+    chunks = get_cached_response(snapshot, schedule, "week2", None, lambda: build_week_response(
+        schedule, 2, "Расписание на вторую неделю недоступно."))
+    await send_chunks(message.peer_id, chunks)
+
+
+@commands.command("бот расписание", "бр", prefix=True)
+async def date_schedule(message, args):
+    today = date.today()
+    dates = [parse_user_date(arg, today) for arg in args[:2]]
+    if not dates or None in dates:
+        await send_message_with_limit(message.peer_id, "Укажите дату в формате ДД.ММ или две даты: бр ДД.ММ ДД.ММ.")
+        return
 
-    if not bot_enabled:
+    first_date, last_date = dates[0], dates[-1]
+    if last_date < first_date or (last_date - first_date).days >= MAX_RANGE_DAYS:
+        await send_message_with_limit(message.peer_id, f"Можно запросить не больше {MAX_RANGE_DAYS} дней подряд.")
         return
 
-    if command in last_command_time and (now - last_command_time[command]).total_seconds() < 5:
+    schedule = get_chat_schedule(schedule_store.get(), message.peer_id)
+    try:
+        chunks = build_date_range_response(schedule.name, first_date, last_date) if schedule else []
+    except sqlite3.Error as error:
+        print(f"Не удалось прочитать базу расписания: {error!r}")
+        chunks = []
+    await send_chunks(message.peer_id, chunks or ["Расписание на семестр пока недоступно."])
+
+
+@commands.command("бот следующая пара", "бсп")
+async def next_class(message, args):
+    schedule = get_chat_schedule(schedule_store.get(), message.peer_id)
+    lesson = find_next_lesson(schedule.name, datetime.now()) if schedule else None
+    if lesson is not None:
+        response = "Следующая пара:\n\n" + render_lesson(lesson)
+    else:
+        # "Пар нет" говорим, только если это подтверждает база семестра, а не окно недель из univBase.json.
+        try:
+            known = schedule is not None and schedule_db.get_date_range(schedule.name) is not None
+        except sqlite3.Error:
+            known = False
+        response = "Предстоящих пар нет." if known else "Расписание на семестр пока недоступно."
+    await send_message_with_limit(message.peer_id, response)
+
+
+@commands.command("бот пара сейчас", "бпс")
+async def current_class(message, args):
+    current_lesson = get_current_class(get_chat_schedule(schedule_store.get(), message.peer_id))
+    response = "Сейчас пара:\n\n" + current_lesson if current_lesson else "Сейчас нет активных пар."
+    await send_message_with_limit(message.peer_id, response)
+
+
+@commands.command("бот напомни", "бн", prefix=True)
+async def remind(message, args):
+    try:
+        minutes_before = int(args[0])
+    except (ValueError, IndexError):
+        await send_message_with_limit(message.peer_id, "Укажите правильное количество минут.")
         return
+    await set_reminder(minutes_before, message.peer_id, get_chat_schedule(schedule_store.get(), message.peer_id))
 
-    last_command_time[command] = now
 
-    if command == "бот расписание сегодня" or command == "брс":
-        today = datetime.now()
-        today_lessons = get_schedule_by_date(first_week_lessons, today) or get_schedule_by_date(second_week_lessons, today)
-        response = "Расписание на сегодня:\n\n" + "\n".join(today_lessons) if today_lessons else "Расписание на сегодня недоступно."
-        await send_message_with_limit(message.peer_id, response)
+@commands.command("бот напоминать", "бнв", prefix=True)
+async def remind_always(message, args):
+    try:
+        minutes_before = int(args[0])
+    except (ValueError, IndexError):
+        await send_message_with_limit(message.peer_id, "Укажите правильное количество минут.")
+        return
+    await subscribe_reminders(minutes_before, message.peer_id, get_chat_schedule(schedule_store.get(), message.peer_id))
 
-    elif command == "бот расписание завтра" or command == "брз":
-        tomorrow = datetime.now() + timedelta(days=1)
-        tomorrow_lessons = get_schedule_by_date(first_week_lessons, tomorrow) or get_schedule_by_date(second_week_lessons, tomorrow)
-        response = "Расписание на завтра:\n\n" + "\n".join(tomorrow_lessons) if tomorrow_lessons else "Расписание на завтра недоступно."
-        await send_message_with_limit(message.peer_id, response)
 
-    elif command == "бот расписание 1 неделя" or command == "бр1":
-        response = "\n".join(first_week_lessons) if first_week_lessons else "Расписание на первую неделю недоступно."
-        await send_message_with_limit(message.peer_id, response)
+@commands.command("бот не напоминай", "небн")
+async def stop_reminding(message, args):
+    await cancel_reminder(message.peer_id)
 
-    elif command == "бот расписание 2 неделя" or command == "бр2":
-        response = "\n".join(second_week_lessons) if second_week_lessons else "Расписание на вторую неделю недоступно."
-        await send_message_with_limit(message.peer_id, response)
 
-    elif command == "бот пара сейчас" or command == "бпс":
-        today = datetime.now()
-        today_lessons = get_schedule_by_date(first_week_lessons, today) or get_schedule_by_date(second_week_lessons, today)
-        current_lesson = get_current_class(today_lessons)
-        response = "Сейчас пара:\n\n" + current_lesson if current_lesson else "Сейчас нет активных пар."
+@commands.command("бот группа", "бг", prefix=True)
+async def subscribe_group(message, args):
+    if not args:
+        group = get_chat_group(message.peer_id)
+        response = f"Чат подписан на группу {group}." if group else "Укажите номер группы: бг [группа]."
         await send_message_with_limit(message.peer_id, response)
+        return
 
-    elif command.startswith("бот напомни") or command.startswith("бн"):
-        try:
-            if command.startswith("бот напомни"):
-                minutes_before = int(command.split()[2])
-            else:
-                minutes_before = int(command.split()[1])
-            await set_reminder(minutes_before, message.peer_id, first_week_lessons, second_week_lessons)
-        except (ValueError, IndexError):
-            await send_message_with_limit(message.peer_id, "Укажите правильное количество минут.")
-
-    elif command == "бот не напоминай" or command == "небн":
-        await cancel_reminder(message.peer_id)
-
-    elif command == "бот команды" or command == "бк":
-        commands_list = """
+    snapshot = schedule_store.get()
+    group = next((name for name in snapshot.groups if name.lower() == args[0]), None)
+    if group is None:
+        await send_message_with_limit(message.peer_id, f"Группа {args[0]} не найдена.")
+        return
+
+    bot_state.put(SUBSCRIPTIONS_SECTION, str(message.peer_id), group)
+    bot_state.flush()
+    await send_message_with_limit(
+        message.peer_id, f"Чат подписан на группу {group}: расписание будет показываться для неё, "
+                         f"а об изменениях на ближайшие {CHANGE_NOTICE_DAYS} дней бот сообщит сам.")
+
+
+@commands.command("бот отписаться", "бо")
+async def unsubscribe_group(message, args):
+    if get_chat_group(message.peer_id) is None:
+        await send_message_with_limit(message.peer_id, "Чат не подписан ни на одну группу.")
+        return
+    bot_state.delete(SUBSCRIPTIONS_SECTION, str(message.peer_id))
+    bot_state.flush()
+    await send_message_with_limit(message.peer_id, "Подписка на изменения расписания отменена.")
+
+
+@commands.command("бот преподаватель", "бпр", prefix=True)
+async def teacher_search(message, args):
+    await search_lessons(message.peer_id, 'teacher', args, "Ближайшие пары преподавателя",
+                         "Укажите фамилию преподавателя: бпр [фамилия].")
+
+
+@commands.command("бот аудитория", "ба", prefix=True)
+async def room_search(message, args):
+    await search_lessons(message.peer_id, 'room', args, "Ближайшие пары в аудитории",
+                         "Укажите номер аудитории: ба [номер].")
+
+
+@commands.command("бот предмет", "бпм", prefix=True)
+async def subject_search(message, args):
+    schedule = get_chat_schedule(schedule_store.get(), message.peer_id)
+    if schedule is None:
+        await send_message_with_limit(message.peer_id, "Расписание недоступно.")
+        return
+    await search_lessons(message.peer_id, 'subject', args, f"Ближайшие пары группы {schedule.name} по предмету",
+                         "Укажите название предмета: бпм [название].", schedule.name)
+
+
+@commands.command("бот команды", "бк")
+async def show_commands(message, args):
+    commands_list = """
         Доступные команды:
     1. "Бот расписание сегодня/брс" - расписание на сегодня.
     2. "Бот расписание завтра/брз" - расписание на завтра.
     3. "Бот расписание 1 неделя/бр1" - расписание на первую неделю.
     4. "Бот расписание 2 неделя/бр2" - расписание на вторую неделю.
     5. "Бот напомни [число]/бн [число]" - установить напоминание.
-    6. "Бот не напоминай/небн" - отключить напоминание.
-    7. "Бот пара сейчас/бпс" - текущая пара.
-    8. "Бот команды/бк" - меню.
+    6. "Бот напоминать [число]/бнв [число]" - напоминать перед каждой парой.
+    7. "Бот не напоминай/небн" - отключить все напоминания.
+    8. "Бот пара сейчас/бпс" - текущая пара.
+    9. "Бот следующая пара/бсп" - следующая пара.
+    10. "Бот расписание ДД.ММ/бр ДД.ММ [ДД.ММ]" - расписание на дату или период.
+    11. "Бот группа [группа]/бг [группа]" - подписать чат на группу и её изменения.
+    12. "Бот отписаться/бо" - отменить подписку.
+    13. "Бот преподаватель [фамилия]/бпр [фамилия]" - где и когда пары у преподавателя.
+    14. "Бот аудитория [номер]/ба [номер]" - ближайшие пары в аудитории.
+    15. "Бот предмет [название]/бпм [название]" - когда следующая пара по предмету.
+    16. "Бот команды/бк" - меню.
         """
-        await send_message_with_limit(message.peer_id, commands_list)
+    await send_message_with_limit(message.peer_id, commands_list)
+
+
+@bot.on.message()
+async def handle_commands(message):
+    command = message.text.lower().strip()
+
+    if message.from_id in AUTHORIZED_USER_IDS and message.peer_id == message.from_id:
+        resolved = admin_commands.resolve(command)
+        if resolved is not None:
+            handler, name, args = resolved
+            with command_latency.time(name):
+                await handler(message, args)
+            return
+
+    if not bot_enabled:
+        return
+
+    resolved = commands.resolve(command)
+    if resolved is None:
+        return
+
+    handler, name, args = resolved
+    if command_debounce.hit((message.peer_id, name, tuple(args)), time_module.monotonic()):
+        return
+    with command_latency.time(name):
+        await handler(message, args)
 
 
 if __name__ == "__main__":
     nest_asyncio.apply()
+    start_metrics_server()
     loop = asyncio.get_event_loop()
     loop.create_task(check_reminders())
-    loop.create_task(update_lessons_periodically())
+    loop.create_task(process_deletions())
+    loop.create_task(outbound_queue.run())
+    loop.run_until_complete(schedule_store.listen())
+    refresh_reminder_subscriptions()
+    sync_search_index()
     bot.run_forever()
@@ -0,0 +1,113 @@
+import asyncio
+import itertools
+import json
+import time as time_module
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+GROUP_ID = 1
+
+
+class FakeVKAPI:
+    def __init__(self, poll_wait: float = 0.5):
+        self.poll_wait = poll_wait
+        self.calls = Counter()
+        self.sent = []
+        self.deleted = defaultdict(list)
+        self._events = []
+        self._ts = 1
+        self._new_event = asyncio.Event()
+        self._cmids = itertools.count(1)
+        self._event_ids = itertools.count(1)
+        self._runner = None
+        self.base_url = None
+
+    async def start(self) -> 'FakeVKAPI':
+        app = web.Application()
+        app.router.add_route('*', '/method/{method}', self.handle_method)
+        app.router.add_route('*', '/longpoll', self.handle_longpoll)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    def inject_message(self, peer_id: int, from_id: int, text: str) -> int:
+        event_id = next(self._event_ids)
+        self._events.append({
+            "type": "message_new",
+            "event_id": str(event_id),
+            "v": "5.199",
+            "group_id": GROUP_ID,
+            "object": {
+                "message": {
+                    "date": int(time_module.time()),
+                    "from_id": from_id,
+                    "id": 0,
+                    "out": 0,
+                    "peer_id": peer_id,
+                    "text": text,
+                    "conversation_message_id": next(self._cmids),
+                    "fwd_messages": [],
+                    "important": False,
+                    "random_id": 0,
+                    "attachments": [],
+                    "is_hidden": False,
+                    "version": 1,
+                },
+                "client_info": {
+                    "button_actions": ["text"],
+                    "keyboard": True,
+                    "inline_keyboard": True,
+                    "carousel": True,
+                    "lang_id": 0,
+                },
+            },
+        })
+        self._new_event.set()
+        return event_id
+
+    async def handle_longpoll(self, request: web.Request) -> web.Response:
+        ts = int(request.query.get('ts', self._ts))
+        if ts >= self._ts + len(self._events) or not self._events:
+            self._new_event.clear()
+            try:
+                await asyncio.wait_for(self._new_event.wait(), timeout=self.poll_wait)
+            except asyncio.TimeoutError:
+                pass
+        updates, self._events = self._events, []
+        self._ts += len(updates)
+        return web.json_response({"ts": str(self._ts), "updates": updates})
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] += 1
+        data = dict(await request.post())
+        data.update(request.query)
+
+        if method == 'groups.getById':
+            response = {"groups": [{"id": GROUP_ID, "name": "fake", "screen_name": "fake", "type": "group"}]}
+        elif method == 'groups.getLongPollServer':
+            response = {"server": f"{self.base_url}/longpoll", "key": "key", "ts": str(self._ts)}
+        elif method == 'messages.send':
+            peer_ids = [int(peer_id) for peer_id in str(data.get('peer_ids') or data.get('peer_id')).split(',')]
+            now = time_module.perf_counter()
+            response = []
+            for peer_id in peer_ids:
+                self.sent.append((now, peer_id, data.get('message', '')))
+                response.append({"peer_id": peer_id, "message_id": 0, "conversation_message_id": next(self._cmids)})
+        elif method == 'messages.delete':
+            cmids = [int(cmid) for cmid in str(data.get('cmids', '')).split(',') if cmid]
+            self.deleted[int(data['peer_id'])].extend(cmids)
+            response = [{"peer_id": int(data['peer_id']), "conversation_message_id": cmid, "response": True}
+                        for cmid in cmids]
+        else:
+            response = 1
+
+        return web.Response(text=json.dumps({"response": response}), content_type='application/json')
@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time as time_module
+import tracemalloc
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_vk import FakeVKAPI
+
+COMMAND_MIX = {
+    "брс": 30,
+    "брз": 15,
+    "бр1": 8,
+    "бр2": 5,
+    "бпс": 25,
+    "бн 10": 8,
+    "небн": 3,
+    "бк": 2,
+    "привет всем": 20,
+}
+
+
+def write_current_schedule(path: str):
+    # Сохранённое расписание переносится на текущую и следующую недели.
+    with open(os.path.join(ROOT, 'univBase.json'), 'r', encoding='utf-8') as file:
+        data = json.load(file)
+
+    monday = date.today() - timedelta(days=date.today().weekday())
+    for group_data in data["groups"].values():
+        shifts = {week: monday + timedelta(days=7 * (int(week) - 1)) - date.fromisoformat(start)
+                  for week, start in group_data["weeks"].items()}
+        group_data["weeks"] = {week: (date.fromisoformat(start) + shifts[week]).isoformat()
+                               for week, start in group_data["weeks"].items()}
+        for lesson in group_data["lessons"]:
+            lesson["date"] = (date.fromisoformat(lesson["date"]) + shifts[str(lesson["week"])]).isoformat()
+
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False)
+
+
+def percentiles(values: list[float]) -> str:
+    if not values:
+        return "n/a"
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return (f"p50={pick(0.5) * 1000:.2f}ms p95={pick(0.95) * 1000:.2f}ms "
+            f"p99={pick(0.99) * 1000:.2f}ms max={values[-1] * 1000:.2f}ms n={len(values)}")
+
+
+async def monitor_loop_lag(lags: list[float], interval: float = 0.01):
+    while True:
+        started = time_module.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time_module.perf_counter() - started - interval)
+
+
+def instrument_handlers(user_bot, latencies: dict):
+    resolve = user_bot.commands.resolve
+
+    def timed_resolve(text):
+        resolved = resolve(text)
+        if resolved is None:
+            return None
+        handler, name, args = resolved
+
+        async def timed_handler(message, handler_args):
+            started = time_module.perf_counter()
+            try:
+                await handler(message, handler_args)
+            finally:
+                latencies[name].append(time_module.perf_counter() - started)
+
+        return timed_handler, name, args
+
+    user_bot.commands.resolve = timed_resolve
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix='univbot-load-')
+    os.chdir(workdir)
+    write_current_schedule('univBase.json')
+
+    import UserBot
+    import DeletionQueue
+
+    logging.getLogger('vkbottle').setLevel(logging.WARNING)
+    DeletionQueue.DELETE_GRANULARITY = 1
+    UserBot.deletion_queue.delete_after = args.delete_after
+
+    fake_vk = await FakeVKAPI().start()
+    UserBot.bot.api.API_URL = f"{fake_vk.base_url}/method/"
+
+    latencies = defaultdict(list)
+    instrument_handlers(UserBot, latencies)
+    lags = []
+
+    # Трассировка аллокаций сама замедляет цикл событий, поэтому включается отдельно.
+    if args.trace_memory:
+        tracemalloc.start()
+    memory_before, _ = tracemalloc.get_traced_memory()
+
+    tasks = [asyncio.create_task(coroutine) for coroutine in (
+        UserBot.check_reminders(),
+        UserBot.process_deletions(),
+        UserBot.outbound_queue.run(),
+        UserBot.bot.run_polling(),
+        monitor_loop_lag(lags),
+    )]
+
+    rng = random.Random(args.seed)
+    peers = [2000000000 + i for i in range(args.peers)]
+    schedule = UserBot.schedule_store.get().group()
+    started = datetime.now()
+    for index in range(args.reminders):
+        lesson = rng.choice(schedule.lessons)
+        peer_id = rng.choice(peers)
+        UserBot.reminder_scheduler.add(f"{peer_id}_{index}", {
+            "time": started + timedelta(seconds=rng.uniform(0, args.duration)),
+            "lesson": lesson,
+            "minutes_before": 10,
+            "peer_id": peer_id,
+        })
+
+    commands, weights = zip(*COMMAND_MIX.items())
+    injected = 0
+    load_started = time_module.perf_counter()
+    next_arrival = 0.0
+    while time_module.perf_counter() - load_started < args.duration:
+        # Прибытия пуассоновские; отставание цикла не снижает заданную нагрузку.
+        elapsed = time_module.perf_counter() - load_started
+        while next_arrival <= elapsed:
+            fake_vk.inject_message(rng.choice(peers), rng.randrange(1, 100000), rng.choices(commands, weights)[0])
+            injected += 1
+            next_arrival += rng.expovariate(args.rate)
+        await asyncio.sleep(0.01)
+
+    drain_deadline = time_module.perf_counter() + args.drain
+    while time_module.perf_counter() < drain_deadline and (len(UserBot.outbound_queue) or len(UserBot.deletion_queue)):
+        await asyncio.sleep(0.1)
+
+    memory_after, memory_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await fake_vk.stop()
+
+    print(f"peers={args.peers} duration={args.duration}s rate={args.rate}/s injected={injected} "
+          f"reminders={args.reminders} workdir={workdir}")
+    print("handler latency:")
+    for name, values in sorted(latencies.items()):
+        print(f"  {name:<24} {percentiles(values)}")
+    print(f"event loop lag: {percentiles(lags)}")
+    print("API calls: " + ", ".join(f"{method}={count}" for method, count in sorted(fake_vk.calls.items())))
+    reminder_messages = sum(1 for _, _, text in fake_vk.sent if "!!!Напоминание!!!" in text)
+    print(f"messages delivered={len(fake_vk.sent)} reminder deliveries={reminder_messages} "
+          f"reply deliveries={len(fake_vk.sent) - reminder_messages} "
+          f"deleted={sum(map(len, fake_vk.deleted.values()))} "
+          f"left in outbound queue={len(UserBot.outbound_queue)} pending deletions={len(UserBot.deletion_queue)}")
+    if args.trace_memory:
+        print(f"memory: before={memory_before / 1024:.0f}KiB after={memory_after / 1024:.0f}KiB "
+              f"growth={(memory_after - memory_before) / 1024:.0f}KiB peak={memory_peak / 1024:.0f}KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон UserBot против поддельного VK API.")
+    parser.add_argument('--peers', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--rate', type=float, default=50, help="входящих сообщений в секунду")
+    parser.add_argument('--reminders', type=int, default=500)
+    parser.add_argument('--delete-after', type=float, default=5)
+    parser.add_argument('--drain', type=float, default=15)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--trace-memory', action='store_true', help="замерить рост памяти через tracemalloc")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import glob
+import os
+import sys
+import time as time_module
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ParsingSite
+from timetable_server import FIXTURES_DIR
+
+
+PARSER_CACHES = (ParsingSite.parse_cell_payload, ParsingSite.parse_time_range, ParsingSite.parse_date)
+
+
+def clear_caches():
+    for cached in PARSER_CACHES:
+        cached.cache_clear()
+
+
+def measure(backend: str, content: bytes, repeat: int) -> tuple[float, float, int, list]:
+    # Кэши разбора общие для всех парсеров: без очистки первый парсер прогревал бы их для второго.
+    clear_caches()
+    started = time_module.perf_counter()
+    lessons = ParsingSite.parse_lessons(content, backend)
+    cold = time_module.perf_counter() - started
+
+    clear_caches()
+    tracemalloc.start()
+    ParsingSite.parse_lessons(content, backend)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time_module.perf_counter()
+    for _ in range(repeat):
+        ParsingSite.parse_lessons(content, backend)
+    warm = (time_module.perf_counter() - started) / repeat
+    return cold, warm, peak, lessons
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение скорости и памяти парсеров расписания.")
+    parser.add_argument('--fixtures', default=os.path.join(FIXTURES_DIR, '*.htm'))
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--backends', nargs='+', default=sorted(ParsingSite.PARSER_BACKENDS))
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(args.fixtures))
+    assert paths, f"Нет страниц по шаблону {args.fixtures}"
+
+    print(f"{'page':<24}{'backend':<8}{'lessons':>8}{'cold, ms':>12}{'warm, ms':>12}{'peak, KiB':>12}")
+    totals = {backend: [0.0, 0.0, 0] for backend in args.backends}
+    for path in paths:
+        with open(path, 'rb') as file:
+            content = file.read()
+
+        reference = None
+        for backend in args.backends:
+            cold, warm, peak, lessons = measure(backend, content, args.repeat)
+            if reference is None:
+                reference = lessons
+            assert lessons == reference, f"{backend} разобрал {os.path.basename(path)} иначе, чем {args.backends[0]}"
+            totals[backend][0] += cold
+            totals[backend][1] += warm
+            totals[backend][2] = max(totals[backend][2], peak)
+            print(f"{os.path.basename(path):<24}{backend:<8}{len(lessons):>8}{cold * 1000:>12.2f}{warm * 1000:>12.2f}"
+                  f"{peak / 1024:>12.1f}")
+
+    for backend, (cold, warm, peak) in totals.items():
+        print(f"{backend}: mean cold {cold / len(paths) * 1000:.2f} ms/page, warm {warm / len(paths) * 1000:.2f} ms/page, "
+              f"max peak {peak / 1024:.1f} KiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import time as time_module
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ParsingSite
+from timetable_server import TimetableServer, load_fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обновление расписания многих групп с локального сервера-заглушки.")
+    parser.add_argument('--groups', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help="задержка ответа сервера, с")
+    parser.add_argument('--fetch-workers', type=int, default=ParsingSite.FETCH_WORKERS)
+    parser.add_argument('--parse-workers', type=int, default=ParsingSite.PARSE_WORKERS)
+    parser.add_argument('--no-etag', action='store_true', help="сервер без ETag/Last-Modified, только сравнение хэша")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    server = TimetableServer(fixtures, latency=args.latency, conditional=not args.no_etag).start()
+    ParsingSite.TIMETABLE_BASE_URL = server.base_url
+    groups = [f"{100 + i}{'abcs'[i % 4]}" for i in range(args.groups)]
+
+    fetch_state = {}
+
+    def scrape():
+        started = time_module.perf_counter()
+        result = ParsingSite.scrape_groups(
+            groups, 'osenniy', fetch_state,
+            fetch_workers=args.fetch_workers,
+            parse_workers=args.parse_workers,
+        )
+        return result, time_module.perf_counter() - started
+
+    try:
+        lessons_by_group, elapsed = scrape()
+        unchanged_by_group, unchanged_elapsed = scrape()
+    finally:
+        server.stop()
+
+    missing = sorted(set(groups) - set(lessons_by_group))
+    assert not missing, f"Нет расписания для групп: {missing[:10]}"
+    for group, lessons in lessons_by_group.items():
+        assert lessons, f"Пустое расписание группы {group}"
+
+    print(f"groups={len(groups)} requests={server.request_count} latency={args.latency}s "
+          f"fetch_workers={args.fetch_workers} parse_workers={args.parse_workers}")
+    print(f"total={elapsed:.2f}s per_group={elapsed / len(groups) * 1000:.1f}ms")
+    print(f"unchanged refresh: total={unchanged_elapsed:.2f}s parsed={len(unchanged_by_group)} "
+          f"not_modified={server.not_modified_count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import hashlib
+import os
+import threading
+import time as time_module
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures')
+
+
+def load_fixtures(fixtures_dir: str = FIXTURES_DIR) -> dict[str, bytes]:
+    fixtures = {}
+    for name in sorted(os.listdir(fixtures_dir)):
+        if name.endswith('.htm'):
+            with open(os.path.join(fixtures_dir, name), 'rb') as file:
+                fixtures[name[:-4]] = file.read()
+    return fixtures
+
+
+class TimetableServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, fixtures: dict[str, bytes], latency: float = 0.0, conditional: bool = True):
+        super().__init__(('127.0.0.1', 0), TimetableHandler)
+        self.fixtures = fixtures
+        self.fixture_names = sorted(fixtures)
+        self.latency = latency
+        self.conditional = conditional
+        self.request_count = 0
+        self.not_modified_count = 0
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def get_page(self, group: str) -> bytes:
+        if group in self.fixtures:
+            return self.fixtures[group]
+        # Для произвольных групп отдаём одну из сохранённых страниц.
+        return self.fixtures[self.fixture_names[sum(map(ord, group)) % len(self.fixture_names)]]
+
+    def start(self) -> 'TimetableServer':
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class TimetableHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.request_count += 1
+        if self.server.latency:
+            time_module.sleep(self.server.latency)
+
+        name = self.path.rsplit('/', 1)[-1]
+        if not name.endswith('.htm'):
+            self.send_error(404)
+            return
+
+        body = self.server.get_page(name[:-4])
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.server.conditional and self.headers.get('If-None-Match') == etag:
+            self.server.not_modified_count += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        if self.server.conditional:
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', 'Mon, 04 Nov 2024 10:00:00 GMT')
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass